@@ -10,6 +10,7 @@ import os
 from typing import Optional
 import numpy as np
 import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import pathlib
 import pickle
 import tqdm
@@ -658,10 +659,19 @@ class DataModuleEnd2End(LightningDataModule):
         return loader
     
     def test_dataloader(self):
+        dataloader_kwargs = dict(self.dataloader_cfg.test)
+
+        if dataloader_kwargs.get('num_workers', 0) > 0:
+            # Keep the workers (and their hdf5 handles and caches) alive
+            # across test epochs, and read a few batches ahead. Both can
+            # still be overridden from the dataloader_cfg.
+            dataloader_kwargs.setdefault('persistent_workers', True)
+            dataloader_kwargs.setdefault('prefetch_factor', 4)
+
         loader = torch.utils.data.DataLoader(
             dataset=self.test_dataset,
             collate_fn=collate_slakh,
-            **self.dataloader_cfg.test
+            **dataloader_kwargs
         )
         return loader
 
@@ -1,25 +1,233 @@
+import collections
+import concurrent.futures
+import functools
 import os
 from typing import List, Optional
 import numpy as np
 import h5py
-import librosa
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import pathlib
 import pickle
-import matplotlib.pyplot as plt
 
 import torch
 from pytorch_lightning.core.datamodule import LightningDataModule
 
-from jointist.data.augmentors import Augmentor
-from jointist.data.samplers import (
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; the datasets fall back to the NumPy rasterizer.
+    njit = None
+
+from End2End.data.augmentors import Augmentor
+from End2End.data.samplers import (
     SegmentSampler,
     DistributedSamplerWrapper,
     CompoundSegmentSampler,
     SamplerInstrumentsClassification,
 )
-from jointist.data.target_processors import TargetProcessor
-from jointist.utils import int16_to_float32
-from jointist.config import SAMPLE_RATE, CLASSES_NUM, BEGIN_NOTE, PLUGIN_LB_TO_IX, PLUGIN_LABELS_NUM
+from End2End.data.target_processors import TargetProcessor
+from End2End.utils import int16_to_float32
+from End2End.constants import SAMPLE_RATE, CLASSES_NUM, BEGIN_NOTE, PLUGIN_LB_TO_IX, PLUGIN_LABELS_NUM
+
+# Set JOINTIST_DATASET_DEBUG=1 to dump waveforms / MIDI / target plots from
+# the datasets. Kept behind an env var so the debug code costs workers
+# nothing in normal training.
+_DEBUG = bool(os.environ.get('JOINTIST_DATASET_DEBUG'))
+
+# HDF5 chunk cache settings for waveform files. The h5py defaults (1 MiB,
+# 521 slots) evict chunks between overlapping segment reads from the same
+# song, so each chunk gets decompressed repeatedly. rdcc_nslots is a prime
+# well above 10x the number of chunks the cache can hold.
+HDF5_CACHE_KWARGS = {
+    'rdcc_nbytes': 64 * 1024 * 1024,
+    'rdcc_nslots': 1_000_003,
+    'rdcc_w0': 0.75,
+}
+
+
+if njit is not None:
+
+    @njit(cache=True, nogil=True)
+    def _rasterize_notes(bgn_frames, end_frames, bgn_pitches, onset_roll, frame_roll):
+        r"""Write note onsets and frame spans into preallocated rolls.
+
+        Compiled with numba: tight integer loops with plain array stores,
+        cached across workers and GIL-free so it can run on a thread pool.
+        """
+        for n in range(bgn_frames.shape[0]):
+            pitch = bgn_pitches[n]
+            onset_roll[bgn_frames[n], pitch] = 1.0
+
+            for frame in range(bgn_frames[n], end_frames[n]):
+                frame_roll[frame, pitch] = 1.0
+
+else:
+    _rasterize_notes = None
+
+
+# At most this many entries are kept per handle cache. Every open h5py.File
+# holds an fd plus up to rdcc_nbytes of chunk cache, so an unbounded cache
+# would exhaust the default fd limit (and many GB of RAM) over a full epoch
+# of Slakh-scale data. The mmap and parsed-MIDI caches share the same cap.
+HANDLE_CACHE_SIZE = 64
+
+
+def get_cached_hdf5(cache, path):
+    r"""Return a read-only h5py.File for path, reusing an already open handle.
+
+    Opening an HDF5 file costs a few ms of metadata parsing and throws away
+    the warmed-up chunk cache, so datasets keep a {path: File} dict and open
+    each file once per DataLoader worker. The dict is kept in least-recently-
+    used order, and above HANDLE_CACHE_SIZE entries the coldest handle is
+    closed, bounding fds and chunk-cache memory.
+
+    Args:
+        cache: dict, {path: h5py.File}, in least-recently-used order
+        path: str
+
+    Returns:
+        hf: h5py.File
+    """
+    hf = cache.get(path)
+
+    if hf is None:
+        hf = h5py.File(path, 'r', **HDF5_CACHE_KWARGS)
+        cache[path] = hf
+
+        if len(cache) > HANDLE_CACHE_SIZE:
+            cache.pop(next(iter(cache))).close()
+
+    else:
+        # Reinsert so dict order tracks recency of use.
+        del cache[path]
+        cache[path] = hf
+
+    return hf
+
+
+@functools.lru_cache(maxsize=1024)
+def load_note_arrays(pkl_path):
+    r"""Load one track's note events as columnar arrays.
+
+    Prefers the .npz table written by pkl2notes_npz.py: each column is
+    decompressed once and sliced per instrument, so no per-note Python
+    dicts are allocated. Tracks without a table fall back to unpickling
+    the dict-of-dicts and converting in memory. Cached per worker, so only
+    the first segment of a track pays the load cost in an epoch.
+
+    Args:
+        pkl_path: str
+
+    Returns:
+        list of (program_num, starts, ends, pitches)
+    """
+    npz_path = pkl_path[:-4] + '.npz'
+
+    if os.path.exists(npz_path):
+        table = np.load(npz_path)
+        offsets = table['instrument_offsets']
+        program_nums = table['program_num']
+
+        # Read each column once; indexing the NpzFile inside the loop would
+        # re-extract the whole column from the archive per instrument.
+        starts = table['start']
+        ends = table['end']
+        pitches = table['pitch']
+
+        return [
+            (
+                int(program_nums[k]),
+                starts[offsets[k] : offsets[k + 1]],
+                ends[offsets[k] : offsets[k + 1]],
+                pitches[offsets[k] : offsets[k + 1]],
+            )
+            for k in range(len(offsets) - 1)
+        ]
+
+    events_dict = pickle.load(open(pkl_path, 'rb'))
+
+    note_arrays = []
+
+    for instrument in events_dict.values():
+        note_events = instrument['note_event']
+
+        note_arrays.append(
+            (
+                instrument['program_num'],
+                np.array([note_event['start'] for note_event in note_events]),
+                np.array([note_event['end'] for note_event in note_events]),
+                np.array([note_event['pitch'] for note_event in note_events], dtype=np.int64),
+            )
+        )
+
+    return note_arrays
+
+
+@functools.lru_cache(maxsize=2048)
+def load_plugin_note_arrays(pkl_path):
+    r"""Load one track's note events as columnar arrays per stem.
+
+    Like load_note_arrays, but keeps the stem key and plugin name that the
+    filter dataset needs for target construction. Cached per worker, so a
+    track is unpickled once per epoch instead of once per segment.
+
+    Args:
+        pkl_path: str
+
+    Returns:
+        list of (key, plugin_name, starts, ends)
+    """
+    events_dict = pickle.load(open(pkl_path, 'rb'))
+
+    return [
+        (
+            key,
+            instrument['plugin_name'],
+            np.array([note_event['start'] for note_event in instrument['note_event']]),
+            np.array([note_event['end'] for note_event in instrument['note_event']]),
+        )
+        for key, instrument in events_dict.items()
+    ]
+
+
+def make_worker_rng(seed):
+    r"""Create an np.random.Generator seeded per DataLoader worker.
+
+    PCG64 is about twice as fast as the legacy RandomState, and offsetting
+    the base seed by the worker id keeps the streams decorrelated instead
+    of every forked worker replaying the same draws.
+
+    Args:
+        seed: int
+
+    Returns:
+        np.random.Generator
+    """
+    worker_info = torch.utils.data.get_worker_info()
+    worker_id = worker_info.id if worker_info is not None else 0
+    return np.random.default_rng(seed + worker_id)
+
+
+def worker_init_fn(worker_id):
+    r"""Drop any h5py handles inherited from the main process.
+
+    Handles opened before the DataLoader forks are not safe to share, so
+    each worker starts with empty caches and reopens files on first use.
+    """
+    dataset = torch.utils.data.get_worker_info().dataset
+
+    for sub_dataset in getattr(dataset, 'datasets', [dataset]):
+        for attr in ['_waveform_files', '_midi_events_files', '_waveform_mmaps', '_midi_events_cache', '_stem_files']:
+            if hasattr(sub_dataset, attr):
+                getattr(sub_dataset, attr).clear()
+
+        # Other lazy per-process state: a generator created before the fork
+        # would be shared by every worker (correlated draws), and an
+        # inherited ThreadPoolExecutor's threads do not survive the fork
+        # (its queue would never drain). Both are recreated on first use.
+        for attr in ['_random_generator', '_pool']:
+            if hasattr(sub_dataset, attr):
+                setattr(sub_dataset, attr, None)
 
 
 class DataModule(LightningDataModule):
@@ -37,6 +245,9 @@ class DataModule(LightningDataModule):
         num_workers: int,
         distributed: bool,
         mini_data: bool,
+        prefetch_factor: int = 2,
+        persistent_workers: bool = True,
+        snap_to_chunk: bool = False,
     ):
         r"""Data module.
 
@@ -53,6 +264,9 @@ class DataModule(LightningDataModule):
             num_workers: int
             distributed: bool
             mini_data: bool, set True to use a small amount of data for debugging
+            prefetch_factor: int, batches each worker loads ahead of time
+            persistent_workers: bool, keep workers (and their open hdf5
+                handles) alive between epochs
         """
         super().__init__()
 
@@ -64,6 +278,8 @@ class DataModule(LightningDataModule):
         self.mini_data = mini_data
         self.num_workers = num_workers
         self.distributed = distributed
+        self.prefetch_factor = prefetch_factor
+        self.persistent_workers = persistent_workers
 
         self.train_dataset = Dataset(
             waveform_hdf5s_dir=waveform_hdf5s_dir,
@@ -72,6 +288,7 @@ class DataModule(LightningDataModule):
             frames_per_second=frames_per_second,
             augmentor=augmentor,
             programs=programs,
+            snap_to_chunk=snap_to_chunk,
         )
 
     def setup(self, stage: Optional[str] = None):
@@ -103,7 +320,16 @@ class DataModule(LightningDataModule):
             collate_fn=collate_fn,
             num_workers=self.num_workers,
             pin_memory=True,
+            worker_init_fn=worker_init_fn,
+            prefetch_factor=self.prefetch_factor if self.num_workers > 0 else 2,
+            persistent_workers=self.persistent_workers and self.num_workers > 0,
         )
+
+        # Overlap the host-to-device copy of the next batch with compute.
+        # DDP moves batches itself, so only wrap in the single-device case.
+        if torch.cuda.is_available() and not self.distributed:
+            return CUDAPrefetcher(train_loader)
+
         return train_loader
 
 
@@ -116,6 +342,7 @@ class Dataset:
         frames_per_second: int,
         augmentor: Augmentor,
         programs: List[str],
+        snap_to_chunk: bool = False,
     ):
         r"""Dataset takes the meta of an audio segment as input, and return
         the waveform and targets of the audio segment. Dataset is used by
@@ -137,21 +364,157 @@ class Dataset:
         self.augmentor = augmentor
         self.programs = programs
         self.sample_rate = SAMPLE_RATE
+        self.snap_to_chunk = snap_to_chunk
 
         self.segment_samples = int(SAMPLE_RATE * self.segment_seconds)
         self.classes_num = CLASSES_NUM
         self.begin_note = BEGIN_NOTE
 
-        # random seed
-        self.random_state = np.random.RandomState(1234)
+        # random seed. The Generator is created lazily in _rng() so each
+        # DataLoader worker draws from its own stream.
+        self._seed = 1234
+        self._random_generator = None
 
         # TargetProcessor is used for processing MIDI events to targets.
         self.target_processor = TargetProcessor(
             self.segment_seconds, self.frames_per_second, self.begin_note, self.classes_num
         )
 
+        # Scratch buffers reused by __getitem__: read_direct() fills the int16
+        # one and int16_to_float32() converts into the float32 one, so neither
+        # step allocates per sample.
+        self._waveform_buffer = np.zeros(self.segment_samples, dtype=np.int16)
+        self._waveform_float32 = np.zeros(self.segment_samples, dtype=np.float32)
+
+        # Per-worker h5py handle caches, populated lazily in __getitem__ and
+        # cleared by worker_init_fn after the DataLoader forks.
+        self._waveform_files = {}
+        self._midi_events_files = {}
+
+        # {path: np.memmap | None}, see _get_waveform_mmap().
+        self._waveform_mmaps = {}
+
+        # {path: {program: (midi_events, midi_events_time)}}, see
+        # _get_midi_events().
+        self._midi_events_cache = {}
+
+        # {path: waveform samples}, so steady-state __getitem__ calls skip
+        # the per-sample hf['waveform'].shape metadata round trip.
+        self._waveform_lens = {}
+
+        # Bounded LRU cache of processed targets, keyed by
+        # (midi_events_hdf5_path, start_time, program). With a small
+        # hop_seconds the same segment is revisited across epochs, and
+        # target_processor.process() is deterministic, so repeat visits can
+        # skip the MIDI parsing entirely. Augmentation only touches the
+        # waveform, so cached targets stay valid. Each entry holds ~7 float32
+        # rolls of (frames_num, 88), roughly 2.5 MB, so the cap keeps the
+        # cache at a few hundred MB per DataLoader worker.
+        self._target_cache = collections.OrderedDict()
+        self._target_cache_size = 128
+
         self.tmp = 0
 
+    def _get_waveform_mmap(self, path, waveform_dataset):
+        r"""Memory-map the waveform dataset when it is stored contiguously.
+
+        A contiguous uncompressed dataset can be sliced straight out of the
+        OS page cache as a numpy view, skipping the h5py read path and its
+        userspace copy. Chunked or compressed datasets return None and go
+        through read_direct instead.
+
+        Args:
+            path: str
+            waveform_dataset: h5py.Dataset
+
+        Returns:
+            np.memmap | None
+        """
+        if path in self._waveform_mmaps:
+            # Reinsert so dict order tracks recency of use.
+            waveform_mmap = self._waveform_mmaps.pop(path)
+            self._waveform_mmaps[path] = waveform_mmap
+            return waveform_mmap
+
+        waveform_mmap = None
+
+        if waveform_dataset.chunks is None and waveform_dataset.compression is None:
+            offset = waveform_dataset.id.get_offset()
+
+            if offset is not None:
+                waveform_mmap = np.memmap(
+                    path,
+                    dtype=waveform_dataset.dtype,
+                    mode='r',
+                    offset=offset,
+                    shape=waveform_dataset.shape,
+                )
+
+        self._waveform_mmaps[path] = waveform_mmap
+
+        if len(self._waveform_mmaps) > HANDLE_CACHE_SIZE:
+            self._waveform_mmaps.pop(next(iter(self._waveform_mmaps)))
+
+        return waveform_mmap
+
+    def _rng(self):
+        r"""Per-worker random Generator, see make_worker_rng()."""
+        if self._random_generator is None:
+            self._random_generator = make_worker_rng(self._seed)
+        return self._random_generator
+
+    def _get_midi_events(self, midi_events_hf, path):
+        r"""Read and cache the MIDI events of all programs of one file.
+
+        MIDI events are stored per track rather than per segment, so one
+        read per worker covers every segment drawn from the file. Files
+        preprocessed with the compound 'midi_all' layout are fetched with a
+        single dataset read and grouped in memory, instead of two reads per
+        program.
+
+        Args:
+            midi_events_hf: h5py.File
+            path: str
+
+        Returns:
+            {program: (midi_events, midi_events_time)}
+        """
+        events_per_program = self._midi_events_cache.get(path)
+
+        if events_per_program is not None:
+            # Reinsert so dict order tracks recency of use.
+            del self._midi_events_cache[path]
+            self._midi_events_cache[path] = events_per_program
+            return events_per_program
+
+        events_per_program = {}
+
+        if 'midi_all' in midi_events_hf:
+            rows = midi_events_hf['midi_all'][:]
+            programs = np.char.decode(rows['program'], 'utf-8')
+            events = np.char.decode(rows['event'], 'utf-8')
+
+            for program in np.unique(programs):
+                indexes = np.flatnonzero(programs == program)
+                events_per_program[str(program)] = (events[indexes], rows['time'][indexes])
+
+        else:
+            for program in self.programs:
+                # h5py 2.10 reads str data as bytes objects; astype('S')
+                # packs them so np.char.decode runs one vectorized pass
+                # instead of a Python .decode() per event.
+                events_per_program[program] = (
+                    np.char.decode(midi_events_hf[program]['midi_event'][:].astype('S'), 'utf-8'),
+                    midi_events_hf[program]['midi_event_time'][:],
+                )
+
+        self._midi_events_cache[path] = events_per_program
+
+        if len(self._midi_events_cache) > HANDLE_CACHE_SIZE:
+            self._midi_events_cache.pop(next(iter(self._midi_events_cache)))
+
+        return events_per_program
+
     def __getitem__(self, meta: [str, str, float]):
         r"""Get input and target of a segment for training.
 
@@ -183,47 +546,98 @@ class Dataset:
 
         data_dict = {}
 
-        # Load segment waveform.
-        with h5py.File(waveform_hdf5_path, 'r') as hf:
-            start_sample = int(start_time * self.sample_rate)
-            end_sample = start_sample + self.segment_samples
+        # Load segment waveform. The handle is cached per worker instead of
+        # reopened for every sample.
+        hf = get_cached_hdf5(self._waveform_files, waveform_hdf5_path)
 
-            '''
-            if end_sample >= hf['waveform'].shape[0]:
-                start_sample -= self.segment_samples
-                end_sample -= self.segment_samples
-            '''
-            waveform = int16_to_float32(hf['waveform'][start_sample : end_sample])
-            # (segment_samples,), e.g., (160000,)
+        start_sample = int(start_time * self.sample_rate)
 
-            if len(waveform) < self.segment_samples:
-                valid_length = len(waveform)
-                waveform = librosa.util.fix_length(waveform, size=self.segment_samples, axis=0)
+        if self.snap_to_chunk:
+            # Align the read to the waveform's chunk grid so a segment
+            # decodes exactly one chunk, and move start_time with it so the
+            # targets below stay aligned to the snapped waveform.
+            start_sample = (start_sample // self.segment_samples) * self.segment_samples
+            start_time = start_sample / self.sample_rate
 
-            else:
-                valid_length = self.segment_samples
+        end_sample = start_sample + self.segment_samples
 
-            if self.augmentor:
-                waveform = self.augmentor(waveform)
+        '''
+        if end_sample >= hf['waveform'].shape[0]:
+            start_sample -= self.segment_samples
+            end_sample -= self.segment_samples
+        '''
+        waveform_samples = self._waveform_lens.get(waveform_hdf5_path)
 
-            data_dict['waveform'] = waveform
-            data_dict['valid_length'] = valid_length
+        if waveform_samples is None:
+            waveform_samples = hf['waveform'].shape[0]
+            self._waveform_lens[waveform_hdf5_path] = waveform_samples
+
+        read_samples = min(end_sample, waveform_samples) - start_sample
+
+        waveform_mmap = self._get_waveform_mmap(waveform_hdf5_path, hf['waveform'])
+
+        if waveform_mmap is not None:
+            # Contiguous file: one memcpy straight from the OS page cache.
+            self._waveform_buffer[0 : read_samples] = waveform_mmap[
+                start_sample : start_sample + read_samples
+            ]
+        else:
+            # Read into the preallocated scratch buffer instead of slicing,
+            # which would allocate a new array on every call.
+            hf['waveform'].read_direct(
+                self._waveform_buffer,
+                source_sel=np.s_[start_sample : start_sample + read_samples],
+                dest_sel=np.s_[0 : read_samples],
+            )
+
+        int16_to_float32(
+            self._waveform_buffer[0 : read_samples],
+            out=self._waveform_float32[0 : read_samples],
+        )
+        # (segment_samples,), e.g., (160000,)
+
+        valid_length = read_samples
+
+        # Zero the tail of the buffer instead of padding with
+        # librosa.util.fix_length, which allocated a new array. The buffer
+        # is reused by the next sample, so hand out a private copy.
+        self._waveform_float32[read_samples:] = 0
+        if self.augmentor:
+            # The augmentor reads the scratch directly and writes its
+            # float32 result into the outgoing array, so the intermediate
+            # copy of the unaugmented waveform is skipped.
+            waveform = self.augmentor(
+                self._waveform_float32, out=np.empty(self.segment_samples, dtype=np.float32)
+            )
+        else:
+            waveform = self._waveform_float32.copy()
+
+        data_dict['waveform'] = waveform
+        data_dict['valid_length'] = valid_length
 
         # Load segment MIDI events.
         if self.midi_events_hdf5s_dir:
             midi_events_hdf5_path = os.path.join(self.midi_events_hdf5s_dir, split, hdf5_name)
 
-            with h5py.File(midi_events_hdf5_path, 'r') as midi_events_hf:
-                for program in self.programs:
+            midi_events_hf = get_cached_hdf5(self._midi_events_files, midi_events_hdf5_path)
+
+            for program in self.programs:
+
+                cache_key = (midi_events_hdf5_path, start_time, program)
+                target_dict = self._target_cache.get(cache_key)
 
-                    midi_events = [e.decode() for e in midi_events_hf[program]['midi_event'][:]]
-                    # E.g., [
+                if target_dict is not None:
+                    self._target_cache.move_to_end(cache_key)
+
+                else:
+                    (midi_events, midi_events_time) = self._get_midi_events(
+                        midi_events_hf, midi_events_hdf5_path
+                    )[program]
+                    # midi_events, e.g., [
                     # 'program_change channel=0 program=0 time=0',
                     # 'note_on channel=0 note=67 velocity=73 time=1440',
                     # ...]
-
-                    midi_events_time = midi_events_hf[program]['midi_event_time'][:]
-                    # E.g., [  0.,   1.9149, 2.3034, ...]
+                    # midi_events_time, e.g., [  0.,   1.9149, 2.3034, ...]
 
                     # Process MIDI events of a segment to targets, including piano
                     # rolls, onset rolls, etc.
@@ -235,33 +649,29 @@ class Dataset:
                     #     'onset_roll': (1001, 88),
                     #     ...}
 
-                    for target_type in target_dict.keys():
+                    # Cached arrays are shared between epochs; mark them
+                    # read-only so no consumer mutates them in place.
+                    for target in target_dict.values():
+                        target.setflags(write=False)
+
+                    self._target_cache[cache_key] = target_dict
 
-                        program_target_type = '{}_{}'.format(program, target_type)
-                        # E.g., '0_frame_roll' | 'percussion_frame_roll', ...
+                    if len(self._target_cache) > self._target_cache_size:
+                        self._target_cache.popitem(last=False)
 
-                        data_dict[program_target_type] = target_dict[target_type]
+                for target_type in target_dict.keys():
 
-        # DO NOT DELETE. FOR DEBUG NOW.
-        # if self.tmp == 1:
-        # if valid_length < self.segment_samples // 2:
-        # if True:
-        #     import soundfile
-        #     import matplotlib.pyplot as plt
-        #     from IPython import embed; embed(using=False); os._exit(0)
-        #     # add(note_events, start_time)
-        #     soundfile.write(file='_zz.wav', data=data_dict['waveform'], samplerate=16000)
-        #     # plt.matshow(data_dict['percussion_frame_roll'].T, origin='lower', aspect='auto', cmap='jet')
-        #     # plt.savefig('_zz.pdf')
-        #     from IPython import embed; embed(using=False); os._exit(0)
+                    program_target_type = '{}_{}'.format(program, target_type)
+                    # E.g., '0_frame_roll' | 'percussion_frame_roll', ...
 
-        self.tmp += 1 
+                    data_dict[program_target_type] = target_dict[target_type]
 
-        debugging = False
-        if debugging:
-            plot_waveform_midi_targets(data_dict, start_time, note_events)
+        if _DEBUG:
+            plot_waveform_midi_targets(data_dict, start_time, note_events=None)
             exit()
 
+        self.tmp += 1
+
         return data_dict
 
 
@@ -286,6 +696,69 @@ def add(note_events, start_time):
 
 
 
+# Specialized collate functions generated at runtime, keyed by the batch
+# signature (batch_size, keys, shapes, dtypes). A training run has one
+# fixed signature, so compilation happens once per worker.
+_COMPILED_COLLATE = {}
+
+
+def _compile_collate(signature):
+    r"""Generate a collate function specialized for one batch signature.
+
+    Batch size, keys, per-sample shapes and dtypes never change within a
+    training run, so the generic loop's dict lookups and shape/dtype
+    inference can be partially evaluated away: the generated source
+    hard-codes one preallocated batch tensor and one copy loop per key.
+
+    Args:
+        signature: (batch_size, ((key, shape, dtype_str), ...))
+
+    Returns:
+        callable, (list_data_dict) -> dict of batched tensors
+    """
+    batch_size, keys_shapes_dtypes = signature
+
+    # Pin only when collating in the main process with CUDA available:
+    # a pinned allocation in a forked worker would re-initialize CUDA in
+    # the child (and raises outright on CUDA-less machines). Workers leave
+    # pinning to the DataLoader's pin_memory=True. The process identity is
+    # fixed for the lifetime of the compiled function, so this can be
+    # baked in at compile time.
+    pin_memory = (
+        torch.utils.data.get_worker_info() is None and torch.cuda.is_available()
+    )
+
+    namespace = {'torch': torch, 'np': np}
+    lines = ['def _collate(list_data_dict):', '    np_data_dict = {}']
+
+    for n, (key, shape, dtype_str) in enumerate(keys_shapes_dtypes):
+        namespace['_dtype_{}'.format(n)] = torch.as_tensor(np.empty(0, dtype=np.dtype(dtype_str))).dtype
+
+        lines.append(
+            '    batch = torch.empty({}, dtype=_dtype_{}, pin_memory={})'.format(
+                (batch_size,) + shape, n, pin_memory
+            )
+        )
+        lines.append('    for i in range({}):'.format(batch_size))
+
+        if shape == ():
+            # Scalar entries (e.g. 'valid_length'): plain item assignment.
+            # np.ascontiguousarray would promote the 0-d value to shape
+            # (1,), which cannot broadcast into the 0-d batch slot.
+            lines.append('        batch[i] = list_data_dict[i][{!r}]'.format(key))
+        else:
+            lines.append(
+                '        batch[i].copy_(torch.from_numpy(np.ascontiguousarray(list_data_dict[i][{!r}])))'.format(key)
+            )
+
+        lines.append('    np_data_dict[{!r}] = batch'.format(key))
+
+    lines.append('    return np_data_dict')
+
+    exec('\n'.join(lines), namespace)
+    return namespace['_collate']
+
+
 def collate_fn(list_data_dict):
     r"""Collate input and target of segments to a mini-batch.
 
@@ -301,11 +774,80 @@ def collate_fn(list_data_dict):
             'frame_roll': (batch_size, segment_frames, classes_num),
             ...}
     """
-    np_data_dict = {}
-    for key in list_data_dict[0].keys():
-        np_data_dict[key] = torch.Tensor(np.array([data_dict[key] for data_dict in list_data_dict]))
+    signature = (
+        len(list_data_dict),
+        tuple(
+            (key, np.asarray(value).shape, np.asarray(value).dtype.str)
+            for key, value in list_data_dict[0].items()
+        ),
+    )
+
+    compiled = _COMPILED_COLLATE.get(signature)
+
+    if compiled is None:
+        compiled = _compile_collate(signature)
+        _COMPILED_COLLATE[signature] = compiled
+
+    return compiled(list_data_dict)
+
+
+class CUDAPrefetcher:
+    r"""Iterate a DataLoader and copy each batch to the GPU one step ahead.
+
+    The host-to-device copy of the next batch is issued on a side CUDA
+    stream while the current batch is being consumed, so the PCIe transfer
+    overlaps with compute instead of serializing on the default stream.
+    Non-tensor values are passed through unchanged.
+    """
+
+    def __init__(self, loader, device=None):
+        self.loader = loader
+        self.device = device if device is not None else torch.device('cuda')
+        self._stream = torch.cuda.Stream(device=self.device)
+        self._next_batch = None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self._iterator = iter(self.loader)
+        self._preload()
+        return self
+
+    def _preload(self):
+        try:
+            batch = next(self._iterator)
+        except StopIteration:
+            self._next_batch = None
+            return
+
+        with torch.cuda.stream(self._stream):
+            self._next_batch = {
+                key: value.to(self.device, non_blocking=True)
+                if isinstance(value, torch.Tensor)
+                else value
+                for key, value in batch.items()
+            }
 
-    return np_data_dict
+    def __next__(self):
+        if self._next_batch is None:
+            raise StopIteration
+
+        # Make sure the copy of this batch has finished before handing it
+        # to the training step, then start copying the next one.
+        torch.cuda.current_stream().wait_stream(self._stream)
+        batch = self._next_batch
+
+        # The tensors were allocated on the side stream but are consumed on
+        # the current stream. record_stream tells the caching allocator not
+        # to hand their memory to a later side-stream copy while kernels
+        # here may still be reading it.
+        for value in batch.values():
+            if isinstance(value, torch.Tensor):
+                value.record_stream(torch.cuda.current_stream())
+
+        self._preload()
+        return batch
 
 
 class CompoundDataModule(LightningDataModule):
@@ -323,6 +865,8 @@ class CompoundDataModule(LightningDataModule):
         num_workers: int,
         distributed: bool,
         mini_data: bool,
+        prefetch_factor: int = 2,
+        persistent_workers: bool = True,
     ):
         r"""Data module.
 
@@ -339,6 +883,9 @@ class CompoundDataModule(LightningDataModule):
             num_workers: int
             distributed: bool
             mini_data: bool, set True to use a small amount of data for debugging
+            prefetch_factor: int, batches each worker loads ahead of time
+            persistent_workers: bool, keep workers (and their open hdf5
+                handles) alive between epochs
         """
         super().__init__()
 
@@ -350,6 +897,8 @@ class CompoundDataModule(LightningDataModule):
         self.mini_data = mini_data
         self.num_workers = num_workers
         self.distributed = distributed
+        self.prefetch_factor = prefetch_factor
+        self.persistent_workers = persistent_workers
 
         self.train_dataset = CompoundDataset(
             list_waveform_hdf5s_dir=list_waveform_hdf5s_dir,
@@ -389,12 +938,23 @@ class CompoundDataModule(LightningDataModule):
             collate_fn=collate_fn,
             num_workers=self.num_workers,
             pin_memory=True,
+            worker_init_fn=worker_init_fn,
+            prefetch_factor=self.prefetch_factor if self.num_workers > 0 else 2,
+            persistent_workers=self.persistent_workers and self.num_workers > 0,
         )
+
+        # Overlap the host-to-device copy of the next batch with compute.
+        # DDP moves batches itself, so only wrap in the single-device case.
+        if torch.cuda.is_available() and not self.distributed:
+            return CUDAPrefetcher(train_loader)
+
         return train_loader
 
 
 def energy(x, valid_length):
-    return np.sum(x ** 2) / valid_length
+    # np.dot hits the BLAS sdot kernel in one pass; np.sum(x ** 2) would
+    # allocate a full squared temporary first.
+    return float(np.dot(x, x)) / valid_length
 
 
 class CompoundDataset:
@@ -437,6 +997,14 @@ class CompoundDataset:
 
             self.datasets.append(dataset)
 
+        # Mix buffer reused by __getitem__, so summing the waveforms does
+        # not allocate per sample.
+        self._mix_buffer = np.zeros(self.datasets[0].segment_samples, dtype=np.float32)
+
+        # Thread pool for fetching the sub-datasets concurrently, created
+        # lazily in __getitem__ so each DataLoader worker owns its own.
+        self._pool = None
+
         self.tmp = 0
 
     def __getitem__(self, list_meta):
@@ -466,11 +1034,17 @@ class CompoundDataset:
         assert len(list_meta) == 5
         datasets_num = len(self.datasets)
 
-        list_data_dict = []
+        # The sub-dataset fetches are independent and I/O bound, and h5py
+        # releases the GIL around reads, so run them concurrently instead
+        # of serializing five hdf5 round trips.
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=datasets_num)
 
-        for k in range(datasets_num):
-            data_dict = self.datasets[k].__getitem__(list_meta[k])
-            list_data_dict.append(data_dict)
+        futures = [
+            self._pool.submit(self.datasets[k].__getitem__, list_meta[k])
+            for k in range(datasets_num)
+        ]
+        list_data_dict = [future.result() for future in futures]
 
         new_data_dict = {}
 
@@ -490,31 +1064,24 @@ class CompoundDataset:
         if e2 == 0:
             ratio = 1
 
-        new_data_dict['waveform'] = ratio * list_data_dict[0]['waveform']
-        
-        for k in [1, 2, 4]:
-            new_data_dict['waveform'] += list_data_dict[k]['waveform']
+        # Write the scaled target stem into the reused mix buffer and
+        # accumulate the remaining stems in place, instead of allocating a
+        # fresh array for the product.
+        np.multiply(list_data_dict[0]['waveform'], np.float32(ratio), out=self._mix_buffer)
 
-        # new_data_dict['waveform'] = np.sum([data_dict['waveform'] for data_dict in list_data_dict], axis=0)
+        for k in [1, 2, 4]:
+            self._mix_buffer += list_data_dict[k]['waveform']
 
-        # if self.tmp == 5:
-        # #     import soundfile
-        # # if True:
-        # # if list_data_dict[0]['valid_length'] < list_data_dict[3]['valid_length'] // 2:
-        #     import soundfile
-        #     soundfile.write(file='_zz.wav', data=new_data_dict['waveform'], samplerate=16000)
-        #     soundfile.write(file='_zz2.wav', data=list_data_dict[0]['waveform']*ratio, samplerate=16000)
-        #     soundfile.write(file='_zz3.wav', data=list_data_dict[1]['waveform']+list_data_dict[2]['waveform']+list_data_dict[4]['waveform'], samplerate=16000)
-        #     from IPython import embed; embed(using=False); os._exit(0)
+        # The buffer is reused by the next sample, so hand out a copy.
+        new_data_dict['waveform'] = self._mix_buffer.copy()
 
-        self.tmp += 1
+        # new_data_dict['waveform'] = np.sum([data_dict['waveform'] for data_dict in list_data_dict], axis=0)
 
-        # if self.tmp == 120:
-        debugging = False
-        if debugging:
+        if _DEBUG:
             plot_waveform_midi_targets(new_data_dict, start_time=0, note_events=None)
             exit()
-        # self.tmp += 1
+
+        self.tmp += 1
 
         return new_data_dict
 
@@ -533,6 +1100,9 @@ class DataModuleInstrumentsClassification(LightningDataModule):
         num_workers: int,
         distributed: bool,
         mini_data: bool,
+        prefetch_factor: int = 2,
+        persistent_workers: bool = True,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification data module.
 
@@ -548,6 +1118,9 @@ class DataModuleInstrumentsClassification(LightningDataModule):
             num_workers: int
             distributed: bool
             mini_data: bool, set True to use a small amount of data for debugging
+            prefetch_factor: int, batches each worker loads ahead of time
+            persistent_workers: bool, keep workers (and their open hdf5
+                handles) alive between epochs
         """
         super().__init__()
 
@@ -559,6 +1132,8 @@ class DataModuleInstrumentsClassification(LightningDataModule):
         self.mini_data = mini_data
         self.num_workers = num_workers
         self.distributed = distributed
+        self.prefetch_factor = prefetch_factor
+        self.persistent_workers = persistent_workers
 
         self.train_dataset = DatasetInstrumentsClassification(
             waveform_hdf5s_dir=waveform_hdf5s_dir,
@@ -566,6 +1141,7 @@ class DataModuleInstrumentsClassification(LightningDataModule):
             frames_per_second=frames_per_second,
             augmentor=augmentor,
             classes_num=classes_num,
+            snap_to_chunk=snap_to_chunk,
         )
 
     def setup(self, stage: Optional[str] = None):
@@ -597,7 +1173,16 @@ class DataModuleInstrumentsClassification(LightningDataModule):
             collate_fn=collate_fn,
             num_workers=self.num_workers,
             pin_memory=True,
+            worker_init_fn=worker_init_fn,
+            prefetch_factor=self.prefetch_factor if self.num_workers > 0 else 2,
+            persistent_workers=self.persistent_workers and self.num_workers > 0,
         )
+
+        # Overlap the host-to-device copy of the next batch with compute.
+        # DDP moves batches itself, so only wrap in the single-device case.
+        if torch.cuda.is_available() and not self.distributed:
+            return CUDAPrefetcher(train_loader)
+
         return train_loader
 
 
@@ -609,6 +1194,7 @@ class DatasetInstrumentsClassification:
         frames_per_second: int,
         augmentor: Augmentor,
         classes_num: int,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification dataset takes the meta of an audio
         segment as input, and return the waveform, onset_roll, and targets of
@@ -626,6 +1212,7 @@ class DatasetInstrumentsClassification:
         self.frames_per_second = frames_per_second
         self.augmentor = augmentor
         self.sample_rate = SAMPLE_RATE
+        self.snap_to_chunk = snap_to_chunk
 
         self.segment_samples = int(SAMPLE_RATE * self.segment_seconds)
         self.classes_num = classes_num
@@ -633,8 +1220,37 @@ class DatasetInstrumentsClassification:
         self.piano_notes_num = CLASSES_NUM
         self.plugin_lb_to_ix = PLUGIN_LB_TO_IX
 
-        # random seed
-        self.random_state = np.random.RandomState(1234)
+        # random seed. The Generator is created lazily in _rng() so each
+        # DataLoader worker draws from its own stream.
+        self._seed = 1234
+        self._random_generator = None
+
+        # Scratch buffers reused by __getitem__: read_direct() fills the int16
+        # one and int16_to_float32() converts into the float32 one.
+        self._waveform_buffer = np.zeros(self.segment_samples, dtype=np.int16)
+        self._waveform_float32 = np.zeros(self.segment_samples, dtype=np.float32)
+
+        # Per-worker h5py handle cache, populated lazily in __getitem__ and
+        # cleared by worker_init_fn after the DataLoader forks.
+        self._waveform_files = {}
+
+        # {path: waveform samples}, so steady-state __getitem__ calls skip
+        # the per-sample hf['waveform'].shape metadata round trip.
+        self._waveform_lens = {}
+
+        # Cached onset-roll template. Only 2 * J - 1 cells are non-zero per
+        # sample, so keep one zero matrix and erase the column written for
+        # the previous sample instead of reallocating ~frames_num x 88
+        # zeros on every call.
+        frames_num = int(self.segment_seconds * self.frames_per_second + 1)
+        self._onset_roll_buffer = np.zeros((frames_num, self.piano_notes_num), dtype=np.float32)
+        self._onset_roll_prev_note = None
+
+    def _rng(self):
+        r"""Per-worker random Generator, see make_worker_rng()."""
+        if self._random_generator is None:
+            self._random_generator = make_worker_rng(self._seed)
+        return self._random_generator
 
     def __getitem__(self, meta):
         r"""Get input and target of a segment for training.
@@ -668,46 +1284,79 @@ class DatasetInstrumentsClassification:
 
         data_dict = {}
 
-        # Load segment waveform.
-        with h5py.File(waveform_hdf5_path, 'r') as hf:
+        # Load segment waveform. The handle is cached per worker instead of
+        # reopened for every sample.
+        hf = get_cached_hdf5(self._waveform_files, waveform_hdf5_path)
 
-            start_time = onset_time - self.segment_seconds / 2
+        start_time = onset_time - self.segment_seconds / 2
 
-            if start_time < 0:
-                start_time = 0
+        if start_time < 0:
+            start_time = 0
 
-            start_sample = int(start_time * self.sample_rate)
-            end_sample = start_sample + self.segment_samples
+        start_sample = int(start_time * self.sample_rate)
 
-            if end_sample >= hf['waveform'].shape[0]:
-                start_sample -= self.segment_samples
-                end_sample -= self.segment_samples
+        if self.snap_to_chunk:
+            # Align the read to the waveform's chunk grid so a segment
+            # decodes exactly one chunk, and move start_time with it so the
+            # targets below stay aligned to the snapped waveform.
+            start_sample = (start_sample // self.segment_samples) * self.segment_samples
+            start_time = start_sample / self.sample_rate
 
-            waveform = int16_to_float32(hf['waveform'][start_sample:end_sample])
-            # (segment_samples,), e.g., (160000,)
+        end_sample = start_sample + self.segment_samples
 
-            if self.augmentor:
-                waveform = self.augmentor(waveform)
+        waveform_samples = self._waveform_lens.get(waveform_hdf5_path)
 
-            data_dict['waveform'] = waveform
+        if waveform_samples is None:
+            waveform_samples = hf['waveform'].shape[0]
+            self._waveform_lens[waveform_hdf5_path] = waveform_samples
+
+        if end_sample >= waveform_samples:
+            start_sample -= self.segment_samples
+            end_sample -= self.segment_samples
+
+        hf['waveform'].read_direct(
+            self._waveform_buffer, source_sel=np.s_[start_sample:end_sample]
+        )
+
+        int16_to_float32(self._waveform_buffer, out=self._waveform_float32)
+
+        # The conversion buffer is reused by the next sample, so hand out a
+        # private copy.
+        if self.augmentor:
+            # The augmentor reads the scratch directly and writes its
+            # float32 result into the outgoing array, so the intermediate
+            # copy of the unaugmented waveform is skipped.
+            waveform = self.augmentor(
+                self._waveform_float32, out=np.empty(self.segment_samples, dtype=np.float32)
+            )
+        else:
+            waveform = self._waveform_float32.copy()
+
+        data_dict['waveform'] = waveform
+
+        # Onset roll as input. Erase the cells of the previous sample from
+        # the template, write the new ones, and hand the batch a copy.
+        if self._onset_roll_prev_note is not None:
+            self._onset_roll_buffer[:, self._onset_roll_prev_note] = 0
+        self._onset_roll_prev_note = pitch - BEGIN_NOTE
 
-        # Onset roll as input.
         data_dict['onset_roll'] = get_single_note_onset_roll(
             segment_seconds=self.segment_seconds,
             frames_per_second=self.frames_per_second,
             piano_notes_num=self.piano_notes_num,
             piano_note=pitch - BEGIN_NOTE,
-        )
+            out=self._onset_roll_buffer,
+        ).copy()
 
         # target
-        target = np.zeros(self.classes_num)  # (plugin_names_num,)
+        target = np.zeros(self.classes_num, dtype=np.float32)  # (plugin_names_num,)
         target[plugin_id] = 1
         data_dict['target'] = target
 
         return data_dict
 
 
-def get_single_note_onset_roll(segment_seconds, frames_per_second, piano_notes_num, piano_note):
+def get_single_note_onset_roll(segment_seconds, frames_per_second, piano_notes_num, piano_note, out=None):
     r"""Convert a note into an onset roll.
 
     Args:
@@ -715,6 +1364,8 @@ def get_single_note_onset_roll(segment_seconds, frames_per_second, piano_notes_n
         frames_per_second: int
         piano_notes_num: int, e.g., 88
         piano_note: int
+        out: None | (frames_num, piano_notes_num), an all-zero template to
+            write into instead of allocating a new matrix
 
     Returns:
         onset_roll: (frames_num, piano_notes_num)
@@ -722,7 +1373,11 @@ def get_single_note_onset_roll(segment_seconds, frames_per_second, piano_notes_n
 
     frames_num = int(segment_seconds * frames_per_second + 1)
     center_idx = frames_num // 2
-    onset_roll = np.zeros((frames_num, piano_notes_num))
+
+    if out is None:
+        onset_roll = np.zeros((frames_num, piano_notes_num))
+    else:
+        onset_roll = out
 
     J = 5
 
@@ -749,6 +1404,7 @@ class DataModuleInstrumentsCluster(LightningDataModule):
         distributed: bool,
         mini_data: bool,
         max_instruments_num,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification data module.
 
@@ -785,6 +1441,7 @@ class DataModuleInstrumentsCluster(LightningDataModule):
             frames_per_second=frames_per_second,
             augmentor=augmentor,
             max_instruments_num=max_instruments_num,
+            snap_to_chunk=snap_to_chunk,
         )
 
     def setup(self, stage: Optional[str] = None):
@@ -816,6 +1473,8 @@ class DataModuleInstrumentsCluster(LightningDataModule):
             collate_fn=collate_fn,
             num_workers=self.num_workers,
             pin_memory=True,
+            worker_init_fn=worker_init_fn,
+            persistent_workers=self.num_workers > 0,
         )
         return train_loader
 
@@ -1133,6 +1792,7 @@ class DatasetInstrumentsCluster:
         frames_per_second: int,
         augmentor: Augmentor,
         max_instruments_num,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification dataset takes the meta of an audio
         segment as input, and return the waveform, onset_roll, and targets of
@@ -1151,15 +1811,29 @@ class DatasetInstrumentsCluster:
         self.frames_per_second = frames_per_second
         self.augmentor = augmentor
         self.sample_rate = SAMPLE_RATE
+        self.snap_to_chunk = snap_to_chunk
 
         self.segment_samples = int(SAMPLE_RATE * self.segment_seconds)
         self.begin_note = BEGIN_NOTE
         self.piano_notes_num = CLASSES_NUM
-        self.plugin_lb_to_ix = PLUGIN_LB_TO_IX
         self.max_instruments_num = max_instruments_num
 
-        # random seed
-        self.random_state = np.random.RandomState(1234)
+        # Per-worker h5py handle cache, populated lazily in __getitem__ and
+        # cleared by worker_init_fn after the DataLoader forks.
+        self._waveform_files = {}
+
+        # Joined-path memo keyed on (split, hdf5_name).
+        self._path_cache = {}
+
+        # Scratch buffers reused by __getitem__: read_direct() fills the int16
+        # one and int16_to_float32() converts into the float32 one.
+        self._waveform_buffer = np.zeros(self.segment_samples, dtype=np.int16)
+        self._waveform_float32 = np.zeros(self.segment_samples, dtype=np.float32)
+
+        # Lazily created per-worker thread pool that rasterizes the selected
+        # instruments in parallel; the numba kernel and the NumPy fallback
+        # both release the GIL, and each task writes a disjoint output slot.
+        self._pool = None
 
     def __getitem__(self, meta: [str, str, float]):
         r"""Get input and target of a segment for training.
@@ -1187,107 +1861,165 @@ class DatasetInstrumentsCluster:
 
         [split, hdf5_name, start_time] = meta
 
-        # paths
-        waveform_hdf5_path = os.path.join(self.waveform_hdf5s_dir, split, hdf5_name)
+        # paths, memoized because persistent workers revisit the same track
+        # for many segments
+        paths = self._path_cache.get((split, hdf5_name))
+        if paths is None:
+            paths = (
+                os.path.join(self.waveform_hdf5s_dir, split, hdf5_name),
+                os.path.join(self.notes_pkls_dir, '{}.pkl'.format(pathlib.Path(hdf5_name).stem)),
+            )
+            self._path_cache[(split, hdf5_name)] = paths
+
+        waveform_hdf5_path, pkl_path = paths
 
         data_dict = {}
         # print(hdf5_name, start_time, split)
 
-        # Load segment waveform.
-        with h5py.File(waveform_hdf5_path, 'r') as hf:
-            start_sample = int(start_time * self.sample_rate)
-            end_sample = start_sample + self.segment_samples
-
-            waveform = int16_to_float32(hf['waveform'][start_sample : end_sample])
-            # (segment_samples,), e.g., (160000,)
-
-            if len(waveform) < self.segment_samples:
-                valid_length = len(waveform)
-                waveform = librosa.util.fix_length(waveform, size=self.segment_samples, axis=0)
-
-            else:
-                valid_length = self.segment_samples
-
-            if self.augmentor:
-                waveform = self.augmentor(waveform)
-
-            data_dict['waveform'] = waveform
-            data_dict['valid_length'] = valid_length
+        # Load segment waveform. The handle is cached per worker instead of
+        # reopened for every sample.
+        hf = get_cached_hdf5(self._waveform_files, waveform_hdf5_path)
 
-        pkl_path = os.path.join(self.notes_pkls_dir, '{}.pkl'.format(pathlib.Path(hdf5_name).stem))
-        events_dict = pickle.load(open(pkl_path, 'rb'))
+        start_sample = int(start_time * self.sample_rate)
 
-        frames_num = int(self.frames_per_second * self.segment_seconds) + 1
+        if self.snap_to_chunk:
+            # Align the read to the waveform's chunk grid so a segment
+            # decodes exactly one chunk, and move start_time with it so the
+            # targets below stay aligned to the snapped waveform.
+            start_sample = (start_sample // self.segment_samples) * self.segment_samples
+            start_time = start_sample / self.sample_rate
 
-        mixture_onset_roll = np.zeros((frames_num, self.piano_notes_num))
-        mixture_frame_roll = np.zeros((frames_num, self.piano_notes_num))
-        # sep_onset_rolls = np.zeros((self.max_instruments_num, frames_num, self.piano_notes_num))
-        # sep_frame_rolls = np.zeros((self.max_instruments_num, frames_num, self.piano_notes_num))
-        sep_onset_rolls = []
-        sep_frame_rolls = []
+        end_sample = start_sample + self.segment_samples
 
-        i = 0
-        tmp = []
-        for key in events_dict.keys():
-            # ['S00', 'S01', ...]
+        read_samples = min(end_sample, hf['waveform'].shape[0]) - start_sample
 
-            # from IPython import embed; embed(using=False); os._exit(0)
-            # print(events_dict[key]['program_num'])
+        # Read into the preallocated scratch buffer and convert in place,
+        # so neither step allocates per sample.
+        hf['waveform'].read_direct(
+            self._waveform_buffer,
+            source_sel=np.s_[start_sample : start_sample + read_samples],
+            dest_sel=np.s_[0 : read_samples],
+        )
 
-            sep_onset_roll = np.zeros((frames_num, self.piano_notes_num))
-            sep_frame_roll = np.zeros((frames_num, self.piano_notes_num))
+        int16_to_float32(
+            self._waveform_buffer[0 : read_samples],
+            out=self._waveform_float32[0 : read_samples],
+        )
+        # (segment_samples,), e.g., (160000,)
+
+        valid_length = read_samples
+
+        # Zero the tail of the buffer instead of padding with
+        # librosa.util.fix_length, which allocated a new array. The buffer
+        # is reused by the next sample, so hand out a private copy.
+        self._waveform_float32[read_samples:] = 0
+        if self.augmentor:
+            # The augmentor reads the scratch directly and writes its
+            # float32 result into the outgoing array, so the intermediate
+            # copy of the unaugmented waveform is skipped.
+            waveform = self.augmentor(
+                self._waveform_float32, out=np.empty(self.segment_samples, dtype=np.float32)
+            )
+        else:
+            waveform = self._waveform_float32.copy()
 
-            for note_event in events_dict[key]['note_event']:
-                if (note_event['start'] > start_time and note_event['start'] < start_time + self.segment_seconds) or \
-                (note_event['end'] > start_time and note_event['end'] < start_time + self.segment_seconds):
+        data_dict['waveform'] = waveform
+        data_dict['valid_length'] = valid_length
 
-                    bgn_frame = int((note_event['start'] - start_time) * self.frames_per_second)
-                    bgn_frame = max(0, bgn_frame)
+        note_arrays = load_note_arrays(pkl_path)
 
-                    end_frame = int((note_event['end'] - start_time) * self.frames_per_second)
-                    end_frame = min(end_frame, frames_num)
+        frames_num = int(self.frames_per_second * self.segment_seconds) + 1
 
-                    bgn_pitch = note_event['pitch'] - self.begin_note
+        seg_end = start_time + self.segment_seconds
 
-                    if bgn_pitch < self.piano_notes_num:
-                        mixture_onset_roll[bgn_frame, bgn_pitch] = 1
-                        mixture_frame_roll[bgn_frame : end_frame, bgn_pitch] = 1
-                        sep_onset_roll[bgn_frame, bgn_pitch] = 1
-                        sep_frame_roll[bgn_frame : end_frame, bgn_pitch] = 1
+        # Loop invariants as locals: LOAD_FAST is much cheaper than
+        # LOAD_ATTR in the per-instrument loop.
+        fps = self.frames_per_second
+        begin_note = self.begin_note
+        piano_notes_num = self.piano_notes_num
 
-                        if note_event['start'] < start_time and \
-                        (note_event['end'] > start_time and note_event['end'] < start_time + self.segment_seconds):
-                            mixture_frame_roll[0 : end_frame, bgn_pitch] = 1
-                            sep_frame_roll[0 : end_frame, bgn_pitch] = 1
+        # First pass: reduce every instrument to its note spans and a
+        # ranking weight, without rasterizing anything yet.
+        spans = []
+        tmp = []
+        for (program_num, starts, ends, pitches) in note_arrays:
 
-            sep_onset_rolls.append(sep_onset_roll)
-            sep_frame_rolls.append(sep_frame_roll)
-            tmp.append(np.sum(sep_frame_roll))
+            in_segment = ((starts > start_time) & (starts < seg_end)) | (
+                (ends > start_time) & (ends < seg_end)
+            )
+            playable = (pitches - begin_note) < piano_notes_num
+            keep = in_segment & playable
+
+            bgn_pitches = pitches[keep] - begin_note
+            bgn_frames = np.clip(
+                ((starts[keep] - start_time) * fps).astype(np.int64),
+                0,
+                frames_num,
+            )
+            end_frames = np.minimum(
+                ((ends[keep] - start_time) * fps).astype(np.int64),
+                frames_num,
+            )
+            # Notes that started before the segment were clipped to frame 0
+            # above, which also covers the old carried-over-note branch.
+
+            spans.append((bgn_frames, end_frames, bgn_pitches))
+            # Span lengths rank instruments the same way as summing the
+            # rasterized frame roll, without an O(frames_num * 88) reduce.
+            tmp.append(int((end_frames - bgn_frames).sum()))
+
+        # Only the top-K instruments are kept: partial-select them in O(n)
+        # and order just those K, instead of sorting every instrument.
+        weights = np.asarray(tmp)
+        top_k = min(self.max_instruments_num, len(spans))
+
+        if top_k:
+            locts = np.argpartition(weights, -top_k)[-top_k:]
+            locts = locts[np.argsort(weights[locts])[::-1]]
+        else:
+            locts = []
 
-        # new_sep_onset_rolls = []
-        # new_sep_frame_rolls = []
-        new_sep_onset_rolls = np.zeros((self.max_instruments_num, frames_num, self.piano_notes_num))
-        new_sep_frame_rolls = np.zeros((self.max_instruments_num, frames_num, self.piano_notes_num))
+        new_sep_onset_rolls = np.zeros(
+            (self.max_instruments_num, frames_num, self.piano_notes_num), dtype=np.float32
+        )
+        new_sep_frame_rolls = np.zeros(
+            (self.max_instruments_num, frames_num, self.piano_notes_num), dtype=np.float32
+        )
 
-        locts = np.argsort(tmp)[::-1]
+        # Second pass: rasterize only the K winners, straight into their
+        # output slots. Losing instruments never get a roll allocated, so
+        # peak memory is bounded by K rolls instead of one per instrument.
+        # The winners are independent, so they run on the worker's thread
+        # pool.
+        if self._pool is None and top_k:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+        futures = [
+            self._pool.submit(
+                self._rasterize_slot,
+                spans[loct],
+                new_sep_onset_rolls[i],
+                new_sep_frame_rolls[i],
+                frames_num,
+            )
+            for i, loct in enumerate(locts)
+        ]
 
-        for i in range(min(self.max_instruments_num, len(sep_frame_rolls))):
-            new_sep_onset_rolls[i] = sep_onset_rolls[locts[i]]
-            new_sep_frame_rolls[i] = sep_frame_rolls[locts[i]]
-            # new_sep_onset_rolls.append(sep_onset_rolls[locts[i]])
-            # new_sep_frame_rolls.append(sep_frame_rolls[locts[i]])
+        for future in futures:
+            future.result()
 
-        # new_sep_onset_rolls = np.stack(new_sep_onset_rolls, axis=0)
-        # new_sep_frame_rolls = np.stack(new_sep_frame_rolls, axis=0)
+        # The mixture still covers every instrument: onsets scatter into one
+        # shared roll, and frame spans accumulate in one shared difference
+        # image whose running sum > 0 is the union over instruments.
+        mixture_onset_roll = np.zeros((frames_num, self.piano_notes_num), dtype=np.float32)
+        frame_diff = np.zeros((frames_num + 1, self.piano_notes_num), dtype=np.float32)
 
-        # print(events_dict[key]['program_num'], np.sum(sep_frame_roll))
-        # if np.sum(sep_onset_roll) > 0:        
-        #     sep_onset_rolls[i] = sep_onset_roll
-        #     sep_frame_rolls[i] = sep_frame_roll
-        #     i += 1
+        for bgn_frames, end_frames, bgn_pitches in spans:
+            mixture_onset_roll[bgn_frames, bgn_pitches] = 1
+            np.add.at(frame_diff, (bgn_frames, bgn_pitches), 1)
+            np.add.at(frame_diff, (end_frames, bgn_pitches), -1)
 
-        # if i == self.max_instruments_num:
-        #     break
+        mixture_frame_roll = (np.cumsum(frame_diff[0 : frames_num], axis=0) > 0).astype(np.float32)
 
         data_dict['mixture_onset_roll'] = mixture_onset_roll
         data_dict['mixture_frame_roll'] = mixture_frame_roll
@@ -1296,6 +2028,23 @@ class DatasetInstrumentsCluster:
 
         return data_dict
 
+    def _rasterize_slot(self, span, onset_roll, frame_roll, frames_num):
+        r"""Rasterize one instrument's note spans into its output slot."""
+        bgn_frames, end_frames, bgn_pitches = span
+
+        if _rasterize_notes is not None:
+            _rasterize_notes(bgn_frames, end_frames, bgn_pitches, onset_roll, frame_roll)
+
+        else:
+            onset_roll[bgn_frames, bgn_pitches] = 1
+
+            # Frame spans via a difference image: +1 at each span begin,
+            # -1 at each span end, then a cumulative sum along time.
+            frame_diff = np.zeros((frames_num + 1, self.piano_notes_num), dtype=np.float32)
+            np.add.at(frame_diff, (bgn_frames, bgn_pitches), 1)
+            np.add.at(frame_diff, (end_frames, bgn_pitches), -1)
+            frame_roll[:] = np.cumsum(frame_diff[0 : frames_num], axis=0) > 0
+
 
 
 ###########
@@ -1314,6 +2063,7 @@ class DataModuleInstrumentsCount(LightningDataModule):
         num_workers: int,
         distributed: bool,
         mini_data: bool,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification data module.
 
@@ -1349,6 +2099,7 @@ class DataModuleInstrumentsCount(LightningDataModule):
             frames_per_second=frames_per_second,
             augmentor=augmentor,
             max_instruments_num=max_instruments_num,
+            snap_to_chunk=snap_to_chunk,
         )
 
     def setup(self, stage: Optional[str] = None):
@@ -1380,6 +2131,8 @@ class DataModuleInstrumentsCount(LightningDataModule):
             collate_fn=collate_fn,
             num_workers=self.num_workers,
             pin_memory=True,
+            worker_init_fn=worker_init_fn,
+            persistent_workers=self.num_workers > 0,
         )
         return train_loader
 
@@ -1393,6 +2146,7 @@ class DatasetInstrumentsCount:
         frames_per_second: int,
         augmentor: Augmentor,
         max_instruments_num,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification dataset takes the meta of an audio
         segment as input, and return the waveform, onset_roll, and targets of
@@ -1411,15 +2165,24 @@ class DatasetInstrumentsCount:
         self.frames_per_second = frames_per_second
         self.augmentor = augmentor
         self.sample_rate = SAMPLE_RATE
+        self.snap_to_chunk = snap_to_chunk
 
         self.segment_samples = int(SAMPLE_RATE * self.segment_seconds)
         self.begin_note = BEGIN_NOTE
         self.piano_notes_num = CLASSES_NUM
-        self.plugin_lb_to_ix = PLUGIN_LB_TO_IX
         self.max_instruments_num = max_instruments_num
 
-        # random seed
-        self.random_state = np.random.RandomState(1234)
+        # Per-worker h5py handle cache, populated lazily in __getitem__ and
+        # cleared by worker_init_fn after the DataLoader forks.
+        self._waveform_files = {}
+
+        # Joined-path memo keyed on (split, hdf5_name).
+        self._path_cache = {}
+
+        # Scratch buffers reused by __getitem__: read_direct() fills the int16
+        # one and int16_to_float32() converts into the float32 one.
+        self._waveform_buffer = np.zeros(self.segment_samples, dtype=np.int16)
+        self._waveform_float32 = np.zeros(self.segment_samples, dtype=np.float32)
 
     def __getitem__(self, meta: [str, str, float]):
         r"""Get input and target of a segment for training.
@@ -1447,46 +2210,89 @@ class DatasetInstrumentsCount:
 
         [split, hdf5_name, start_time] = meta
 
-        # paths
-        waveform_hdf5_path = os.path.join(self.waveform_hdf5s_dir, split, hdf5_name)
+        # paths, memoized because persistent workers revisit the same track
+        # for many segments
+        paths = self._path_cache.get((split, hdf5_name))
+        if paths is None:
+            paths = (
+                os.path.join(self.waveform_hdf5s_dir, split, hdf5_name),
+                os.path.join(self.notes_pkls_dir, '{}.pkl'.format(pathlib.Path(hdf5_name).stem)),
+            )
+            self._path_cache[(split, hdf5_name)] = paths
+
+        waveform_hdf5_path, pkl_path = paths
 
         data_dict = {}
 
-        # Load segment waveform.
-        with h5py.File(waveform_hdf5_path, 'r') as hf:
-            start_sample = int(start_time * self.sample_rate)
-            end_sample = start_sample + self.segment_samples
+        # Load segment waveform. The handle is cached per worker instead of
+        # reopened for every sample.
+        hf = get_cached_hdf5(self._waveform_files, waveform_hdf5_path)
 
-            waveform = int16_to_float32(hf['waveform'][start_sample : end_sample])
-            # (segment_samples,), e.g., (160000,)
+        start_sample = int(start_time * self.sample_rate)
 
-            if len(waveform) < self.segment_samples:
-                valid_length = len(waveform)
-                waveform = librosa.util.fix_length(waveform, size=self.segment_samples, axis=0)
+        if self.snap_to_chunk:
+            # Align the read to the waveform's chunk grid so a segment
+            # decodes exactly one chunk, and move start_time with it so the
+            # targets below stay aligned to the snapped waveform.
+            start_sample = (start_sample // self.segment_samples) * self.segment_samples
+            start_time = start_sample / self.sample_rate
 
-            else:
-                valid_length = self.segment_samples
+        end_sample = start_sample + self.segment_samples
 
-            if self.augmentor:
-                waveform = self.augmentor(waveform)
+        read_samples = min(end_sample, hf['waveform'].shape[0]) - start_sample
 
-            data_dict['waveform'] = waveform
-            data_dict['valid_length'] = valid_length
+        # Read into the preallocated scratch buffer and convert in place,
+        # so neither step allocates per sample.
+        hf['waveform'].read_direct(
+            self._waveform_buffer,
+            source_sel=np.s_[start_sample : start_sample + read_samples],
+            dest_sel=np.s_[0 : read_samples],
+        )
 
-        pkl_path = os.path.join(self.notes_pkls_dir, '{}.pkl'.format(pathlib.Path(hdf5_name).stem))
-        events_dict = pickle.load(open(pkl_path, 'rb'))
+        int16_to_float32(
+            self._waveform_buffer[0 : read_samples],
+            out=self._waveform_float32[0 : read_samples],
+        )
+        # (segment_samples,), e.g., (160000,)
+
+        valid_length = read_samples
+
+        # Zero the tail of the buffer instead of padding with
+        # librosa.util.fix_length, which allocated a new array. The buffer
+        # is reused by the next sample, so hand out a private copy.
+        self._waveform_float32[read_samples:] = 0
+        if self.augmentor:
+            # The augmentor reads the scratch directly and writes its
+            # float32 result into the outgoing array, so the intermediate
+            # copy of the unaugmented waveform is skipped.
+            waveform = self.augmentor(
+                self._waveform_float32, out=np.empty(self.segment_samples, dtype=np.float32)
+            )
+        else:
+            waveform = self._waveform_float32.copy()
+
+        data_dict['waveform'] = waveform
+        data_dict['valid_length'] = valid_length
+
+        note_arrays = load_note_arrays(pkl_path)
 
         frames_num = self.frames_per_second * self.segment_seconds + 1
 
+        seg_end = start_time + self.segment_seconds
+        max_count = self.max_instruments_num - 1
+
+        # One vectorized overlap test on the columnar note arrays per
+        # instrument, instead of a Python comparison per note.
         count = 0
-        for key in events_dict.keys():
-            for note_event in events_dict[key]['note_event']:
-                if (note_event['start'] > start_time and note_event['start'] < start_time + self.segment_seconds) or \
-                (note_event['end'] > start_time and note_event['end'] < start_time + self.segment_seconds):
-                    count += 1
-                    break
+        for (program_num, starts, ends, pitches) in note_arrays:
+            in_segment = ((starts > start_time) & (starts < seg_end)) | (
+                (ends > start_time) & (ends < seg_end)
+            )
+
+            if in_segment.any():
+                count += 1
 
-            if count == self.max_instruments_num - 1:
+            if count == max_count:
                 break
 
         select = '2'
@@ -1494,7 +2300,9 @@ class DatasetInstrumentsCount:
             target = np.zeros(self.max_instruments_num)
             target[count] = 1
         elif select == '2':
-            target = np.array([count])
+            # The class index alone; consumers that need a distribution can
+            # one-hot the batched targets themselves.
+            target = np.array([count], dtype=np.int64)
 
         
         data_dict['target'] = target
@@ -1518,6 +2326,7 @@ class DataModuleInstrumentsFilter(LightningDataModule):
         num_workers: int,
         distributed: bool,
         mini_data: bool,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification data module.
 
@@ -1552,6 +2361,7 @@ class DataModuleInstrumentsFilter(LightningDataModule):
             segment_seconds=segment_seconds,
             frames_per_second=frames_per_second,
             augmentor=augmentor,
+            snap_to_chunk=snap_to_chunk,
         )
 
     def setup(self, stage: Optional[str] = None):
@@ -1583,6 +2393,7 @@ class DataModuleInstrumentsFilter(LightningDataModule):
             collate_fn=collate_fn,
             num_workers=self.num_workers,
             pin_memory=True,
+            worker_init_fn=worker_init_fn,
         )
         return train_loader
 
@@ -1595,6 +2406,7 @@ class DatasetInstrumentsFilter:
         segment_seconds: str,
         frames_per_second: int,
         augmentor: Augmentor,
+        snap_to_chunk: bool = False,
     ):
         r"""Instrument classification dataset takes the meta of an audio
         segment as input, and return the waveform, onset_roll, and targets of
@@ -1613,14 +2425,36 @@ class DatasetInstrumentsFilter:
         self.frames_per_second = frames_per_second
         self.augmentor = augmentor
         self.sample_rate = SAMPLE_RATE
+        self.snap_to_chunk = snap_to_chunk
 
         self.segment_samples = int(SAMPLE_RATE * self.segment_seconds)
         self.begin_note = BEGIN_NOTE
         self.piano_notes_num = CLASSES_NUM
         self.plugin_lb_to_ix = PLUGIN_LB_TO_IX
 
-        # random seed
-        self.random_state = np.random.RandomState(1234)
+        # random seed. The Generator is created lazily in _rng() so each
+        # DataLoader worker draws from its own stream.
+        self._seed = 1234
+        self._random_generator = None
+
+        # Per-worker h5py handle caches (mixture waveforms and individual
+        # stems), populated lazily and cleared by worker_init_fn.
+        self._waveform_files = {}
+        self._stem_files = {}
+
+        # Reusable scratch buffers for the waveform read and the int16 ->
+        # float32 conversion, so neither allocates per sample.
+        self._waveform_buffer = np.zeros(self.segment_samples, dtype=np.int16)
+        self._waveform_float32 = np.zeros(self.segment_samples, dtype=np.float32)
+
+        # Zeroed one-hot template copied per sample; float32 because the
+        # model casts the target anyway.
+        self._plugin_zero = np.zeros(PLUGIN_LABELS_NUM, dtype=np.float32)
+
+        # Which stems sound in a segment depends only on (track, start
+        # time), so the scan result is kept in a bounded LRU across epochs.
+        self._presence_cache = collections.OrderedDict()
+        self._presence_cache_size = 4096
 
         self.individual_stems_hdf5s_dir = '/home/tiger/workspaces/jointist/hdf5s/test9'
 
@@ -1630,6 +2464,12 @@ class DatasetInstrumentsFilter:
             classes_num=88
         )
 
+    def _rng(self):
+        r"""Per-worker random Generator, see make_worker_rng()."""
+        if self._random_generator is None:
+            self._random_generator = make_worker_rng(self._seed)
+        return self._random_generator
+
     def __getitem__(self, meta: [str, str, float]):
         r"""Get input and target of a segment for training.
 
@@ -1661,64 +2501,108 @@ class DatasetInstrumentsFilter:
 
         data_dict = {}
 
-        # Load segment waveform.
-        with h5py.File(waveform_hdf5_path, 'r') as hf:
-            start_sample = int(start_time * self.sample_rate)
-            end_sample = start_sample + self.segment_samples
+        # Load segment waveform. The handle stays open in the per-worker
+        # cache, keeping the HDF5 metadata and chunk cache warm across
+        # samples.
+        hf = get_cached_hdf5(self._waveform_files, waveform_hdf5_path)
 
-            waveform = int16_to_float32(hf['waveform'][start_sample : end_sample])
-            # (segment_samples,), e.g., (160000,)
+        start_sample = int(start_time * self.sample_rate)
 
-            if len(waveform) < self.segment_samples:
-                valid_length = len(waveform)
-                waveform = librosa.util.fix_length(waveform, size=self.segment_samples, axis=0)
+        if self.snap_to_chunk:
+            # Align the read to the waveform's chunk grid so a segment
+            # decodes exactly one chunk, and move start_time with it so the
+            # targets below stay aligned to the snapped waveform.
+            start_sample = (start_sample // self.segment_samples) * self.segment_samples
+            start_time = start_sample / self.sample_rate
 
-            else:
-                valid_length = self.segment_samples
+        end_sample = start_sample + self.segment_samples
 
-            if self.augmentor:
-                waveform = self.augmentor(waveform)
+        read_samples = min(end_sample, hf['waveform'].shape[0]) - start_sample
 
-            data_dict['waveform'] = waveform
-            data_dict['valid_length'] = valid_length
+        # read_direct fills the reusable int16 scratch instead of letting
+        # h5py allocate a fresh array on every call.
+        hf['waveform'].read_direct(
+            self._waveform_buffer,
+            source_sel=np.s_[start_sample : start_sample + read_samples],
+            dest_sel=np.s_[0 : read_samples],
+        )
+
+        int16_to_float32(
+            self._waveform_buffer[0 : read_samples],
+            out=self._waveform_float32[0 : read_samples],
+        )
+        # (segment_samples,), e.g., (160000,)
+
+        valid_length = read_samples
+
+        # Zero the tail of the buffer for short end-of-track segments
+        # instead of padding through librosa.util.fix_length. The scratch
+        # is overwritten by the next sample, so pass on a copy.
+        self._waveform_float32[read_samples:] = 0
+        if self.augmentor:
+            # The augmentor reads the scratch directly and writes its
+            # float32 result into the outgoing array, so the intermediate
+            # copy of the unaugmented waveform is skipped.
+            waveform = self.augmentor(
+                self._waveform_float32, out=np.empty(self.segment_samples, dtype=np.float32)
+            )
+        else:
+            waveform = self._waveform_float32.copy()
+
+        data_dict['waveform'] = waveform
+        data_dict['valid_length'] = valid_length
 
         pkl_path = os.path.join(self.notes_pkls_dir, '{}.pkl'.format(pathlib.Path(hdf5_name).stem))
-        events_dict = pickle.load(open(pkl_path, 'rb'))
+        note_arrays = load_plugin_note_arrays(pkl_path)
 
         frames_num = self.frames_per_second * self.segment_seconds + 1
 
-        # count = 0
-        keys = []
-        indexes = []
-        plugin_names = []
+        keys = [entry[0] for entry in note_arrays]
+        plugin_names = [entry[1] for entry in note_arrays]
 
-        for i, key in enumerate(events_dict.keys()):
+        cache_key = (pkl_path, start_time)
+        indexes = self._presence_cache.get(cache_key)
 
-            keys.append(key)
-            plugin_names.append(events_dict[key]['plugin_name'])
+        if indexes is not None:
+            self._presence_cache.move_to_end(cache_key)
 
-            for note_event in events_dict[key]['note_event']:
+        else:
+            seg_end = start_time + self.segment_seconds
 
-                if (note_event['start'] > start_time and note_event['start'] < start_time + self.segment_seconds) or \
-                (note_event['end'] > start_time and note_event['end'] < start_time + self.segment_seconds):
-                    # count += 1
-                    # keys.append(key)
+            # One vectorized overlap test on the start and end columns per
+            # stem, instead of a Python comparison per note.
+            indexes = []
+            for i, (key, plugin_name, starts, ends) in enumerate(note_arrays):
+                in_segment = ((starts > start_time) & (starts < seg_end)) | (
+                    (ends > start_time) & (ends < seg_end)
+                )
+
+                if in_segment.any():
                     indexes.append(i)
-                    break
+
+            self._presence_cache[cache_key] = indexes
+
+            if len(self._presence_cache) > self._presence_cache_size:
+                self._presence_cache.popitem(last=False)
 
         if len(indexes) == 0:
             index = 0
         else:
-            index = self.random_state.choice(indexes, size=1)[0]
+            # Generator.integers picks an index without the size-1 array
+            # that RandomState.choice allocated per call.
+            index = indexes[self._rng().integers(len(indexes))]
 
-        plugin_target = np.zeros(PLUGIN_LABELS_NUM)
+        plugin_target = self._plugin_zero.copy()
         plugin_target[PLUGIN_LB_TO_IX[plugin_names[index]]] = 1
 
         hdf5_path = os.path.join(self.individual_stems_hdf5s_dir, split, pathlib.Path(hdf5_name).stem, '{}.h5'.format(keys[index]))
 
-        with h5py.File(hdf5_path, 'r') as hf:
-            midi_events = [e.decode() for e in hf['0']['midi_event'][:]]
-            midi_events_time = hf['0']['midi_event_time'][:]
+        stem_hf = get_cached_hdf5(self._stem_files, hdf5_path)
+
+        # One vectorized decode for all events instead of a Python .decode()
+        # per event; astype('S') packs the bytes objects h5py 2.10 returns.
+        midi_events = np.char.decode(stem_hf['0']['midi_event'][:].astype('S'), 'utf-8')
+        midi_events_time = stem_hf['0']['midi_event_time'][:]
 
 
         target_dict, note_events, pedal_events = self.target_processor.process(
@@ -17,23 +17,30 @@ class Augmentor:
         self.random_state = np.random.RandomState(1234)
         self.sample_rate = SAMPLE_RATE
 
-    def __call__(self, x):
+    def __call__(self, x, out=None):
         r"""Do augmentation.
 
         Args:
             x: ndarray, (audio_length,)
+            out: None | ndarray, (audio_length,), optional float32 buffer
+                the result is written into, so callers can fuse the
+                conversion and augmentation without an extra copy
 
         Returns:
             ndarray, (audio_length)
         """
 
         if self.augmentation == 'none':
-            return x
+            if out is None:
+                return x
+
+            np.copyto(out, x)
+            return out
 
         elif self.augmentation == 'aug':
-            return self.aug(x)
+            return self.aug(x, out=out)
 
-    def aug(self, x):
+    def aug(self, x, out=None):
         # Todo
         clip_samples = len(x)
 
@@ -63,6 +70,12 @@ class Augmentor:
         aug_x = tfm.build_array(input_array=x, sample_rate_in=self.sample_rate)
         aug_x = pad_truncate_sequence(aug_x, clip_samples)
 
+        if out is not None:
+            # Casts sox's float64 output down to the caller's float32
+            # buffer in one pass.
+            np.copyto(out, aug_x)
+            return out
+
         return aug_x
 
     def loguniform(self, low, high, size):
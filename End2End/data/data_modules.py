@@ -2,11 +2,11 @@ import os
 from typing import List, Optional
 import numpy as np
 import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import librosa
 import pathlib
 import pickle
 # import pretty_midi
-import matplotlib.pyplot as plt
 
 import torch
 from pytorch_lightning.core.datamodule import LightningDataModule
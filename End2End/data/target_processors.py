@@ -191,21 +191,21 @@ class TargetProcessor:
 
         # Prepare targets.
         frames_num = int(round(self.segment_seconds * self.frames_per_second)) + 1
-        onset_roll = np.zeros((frames_num, self.classes_num))
-        offset_roll = np.zeros((frames_num, self.classes_num))
-        reg_onset_roll = np.ones((frames_num, self.classes_num))
-        reg_offset_roll = np.ones((frames_num, self.classes_num))
-        frame_roll = np.zeros((frames_num, self.classes_num))
-        velocity_roll = np.zeros((frames_num, self.classes_num))
-
-        mask_roll = np.ones((frames_num, self.classes_num))
+        onset_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        offset_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        reg_onset_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
+        reg_offset_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
+        frame_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        velocity_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+
+        mask_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
         # mask_roll is used for masking out cross segment notes
 
-        pedal_onset_roll = np.zeros(frames_num)
-        pedal_offset_roll = np.zeros(frames_num)
-        reg_pedal_onset_roll = np.ones(frames_num)
-        reg_pedal_offset_roll = np.ones(frames_num)
-        pedal_frame_roll = np.zeros(frames_num)
+        pedal_onset_roll = np.zeros(frames_num, dtype=np.float32)
+        pedal_offset_roll = np.zeros(frames_num, dtype=np.float32)
+        reg_pedal_onset_roll = np.ones(frames_num, dtype=np.float32)
+        reg_pedal_offset_roll = np.ones(frames_num, dtype=np.float32)
+        pedal_frame_roll = np.zeros(frames_num, dtype=np.float32)
 
         # ------ 2. Get note targets ------
         # Process note events to target.
@@ -327,21 +327,21 @@ class TargetProcessor:
 
         # Prepare targets.
         frames_num = int(round(self.segment_seconds * self.frames_per_second)) + 1
-        onset_roll = np.zeros((frames_num, self.classes_num))
-        offset_roll = np.zeros((frames_num, self.classes_num))
-        reg_onset_roll = np.ones((frames_num, self.classes_num))
-        reg_offset_roll = np.ones((frames_num, self.classes_num))
-        frame_roll = np.zeros((frames_num, self.classes_num))
-        velocity_roll = np.zeros((frames_num, self.classes_num))
-
-        mask_roll = np.ones((frames_num, self.classes_num))
+        onset_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        offset_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        reg_onset_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
+        reg_offset_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
+        frame_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        velocity_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+
+        mask_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
         # mask_roll is used for masking out cross segment notes
 
-        pedal_onset_roll = np.zeros(frames_num)
-        pedal_offset_roll = np.zeros(frames_num)
-        reg_pedal_onset_roll = np.ones(frames_num)
-        reg_pedal_offset_roll = np.ones(frames_num)
-        pedal_frame_roll = np.zeros(frames_num)
+        pedal_onset_roll = np.zeros(frames_num, dtype=np.float32)
+        pedal_offset_roll = np.zeros(frames_num, dtype=np.float32)
+        reg_pedal_onset_roll = np.ones(frames_num, dtype=np.float32)
+        reg_pedal_offset_roll = np.ones(frames_num, dtype=np.float32)
+        pedal_frame_roll = np.zeros(frames_num, dtype=np.float32)
 
         # ------ 2. Get note targets ------
         # Process note events to target.
@@ -408,8 +408,8 @@ class TargetProcessor:
 
         # Prepare targets.
         frames_num = int(round(self.segment_seconds * self.frames_per_second)) + 1
-        beat_roll = np.zeros(frames_num)
-        reg_beat_roll = np.ones(frames_num)
+        beat_roll = np.zeros(frames_num, dtype=np.float32)
+        reg_beat_roll = np.ones(frames_num, dtype=np.float32)
         
         # ------ 2. Get note targets ------
         # Process note events to target.
@@ -583,11 +583,11 @@ class MiniTargetProcessor:
 
         # Prepare targets.
         frames_num = int(round(self.segment_seconds * self.frames_per_second)) + 1
-        onset_roll = np.zeros((frames_num, self.classes_num))
-        reg_onset_roll = np.ones((frames_num, self.classes_num))
-        frame_roll = np.zeros((frames_num, self.classes_num))
+        onset_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+        reg_onset_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
+        frame_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
 
-        mask_roll = np.ones((frames_num, self.classes_num))
+        mask_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
         # mask_roll is used for masking out cross segment notes
 
         # ------ 2. Get note targets ------
@@ -651,8 +651,8 @@ class MiniTargetProcessor:
 
         # Prepare targets.
         frames_num = int(round(self.segment_seconds * self.frames_per_second)) + 1
-        beat_roll = np.zeros(frames_num)
-        reg_beat_roll = np.ones(frames_num)
+        beat_roll = np.zeros(frames_num, dtype=np.float32)
+        reg_beat_roll = np.ones(frames_num, dtype=np.float32)
         
         # ------ 2. Get note targets ------
         # Process note events to target.
@@ -6,6 +6,7 @@ import pandas as pd
 from concurrent.futures import ProcessPoolExecutor
 
 import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import librosa
 import numpy as np
 import musdb
@@ -66,7 +67,16 @@ def pack_audios_to_hdf5s(args):
                 audio = preprocess_audio(audio, mono, track.rate, sample_rate, resample_type)
                 # (audio_samples,)
 
-                hf.create_dataset(name='waveform', data=float32_to_int16(audio), dtype=np.int16)
+                # Same layout as the slakh ingestion: segment-sized chunks
+                # with bitshuffle+LZ4 (filter 32008).
+                hf.create_dataset(
+                    name='waveform',
+                    data=float32_to_int16(audio),
+                    dtype=np.int16,
+                    chunks=(min(len(audio), 160000),),
+                    compression=32008,
+                    compression_opts=(0, 2),
+                )
 
                 hf.attrs.create("duration", data=len(audio) / sample_rate, dtype=np.float32)
 
@@ -8,6 +8,7 @@ import pretty_midi
 import yaml
 import glob
 import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import librosa
 import pickle
 import numpy as np
@@ -87,7 +88,16 @@ def write_single_audio_to_hdf5(param):
         hf.attrs.create("sample_rate", data=sample_rate, dtype=np.int32)
         hf.attrs.create("split", data=split.encode(), dtype="S20")
         hf.attrs.create("duration", data=duration, dtype=np.float32)
-        hf.create_dataset(name="waveform", data=float32_to_int16(audio), dtype=np.int16)
+        # Same layout as the slakh ingestion: segment-sized chunks with
+        # bitshuffle+LZ4 (filter 32008).
+        hf.create_dataset(
+            name="waveform",
+            data=float32_to_int16(audio),
+            dtype=np.int16,
+            chunks=(min(len(audio), 160000),),
+            compression=32008,
+            compression_opts=(0, 2),
+        )
 
     print("{} Write to {}".format(n, hdf5_path))
 
@@ -8,6 +8,7 @@ import pretty_midi
 import yaml
 import glob
 import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import librosa
 import pickle
 import numpy as np
@@ -91,7 +92,17 @@ def write_single_audio_to_hdf5(param):
         hf.attrs.create("sample_rate", data=sample_rate, dtype=np.int32)
         hf.attrs.create("split", data=split.encode(), dtype="S20")
         hf.attrs.create("duration", data=duration, dtype=np.float32)
-        hf.create_dataset(name="waveform", data=float32_to_int16(audio), dtype=np.int16)
+        # Chunk the waveform to the training segment length and compress with
+        # bitshuffle+LZ4 (filter 32008), so one random segment read decodes a
+        # single chunk that the h5py chunk cache can serve again afterwards.
+        hf.create_dataset(
+            name="waveform",
+            data=float32_to_int16(audio),
+            dtype=np.int16,
+            chunks=(min(len(audio), 160000),),
+            compression=32008,
+            compression_opts=(0, 2),
+        )
         source_tracks = hf.create_group("sources")
         
         dirname = os.path.dirname(audio_path)
@@ -110,7 +121,16 @@ def write_single_audio_to_hdf5(param):
                 if source_name in source_tracks.keys():
                     source_tracks[source_name][()] += float32_to_int16(audio)
                 else:              
-                    source_tracks.create_dataset(source_name, data=float32_to_int16(audio), dtype=np.int16)
+                    # The stems are sampled the same way as the mixture,
+                    # so chunk and compress them identically.
+                    source_tracks.create_dataset(
+                        source_name,
+                        data=float32_to_int16(audio),
+                        dtype=np.int16,
+                        chunks=(min(len(audio), 160000),),
+                        compression=32008,
+                        compression_opts=(0, 2),
+                    )
         
         
 
@@ -25,7 +25,8 @@ class TargetProcessor:
                  start_time: float,
                  segment_seconds: float,
                  prettymidi_events,
-                 note_shift=0):
+                 note_shift=0,
+                 out_dict=None):
 
         segment_frames = int(self.frames_per_second * segment_seconds)
 
@@ -54,13 +55,28 @@ class TargetProcessor:
                     'offset_time': prettymidi_event['end']
                 })
 
-        # Prepare targets.
+        # Prepare targets. A caller that consumes the rolls before its next
+        # call can pass its own preallocated buffers through out_dict, which
+        # are reset and filled in place instead of reallocating four
+        # (frames_num, classes_num) float arrays per call.
         frames_num = int(round(segment_seconds * self.frames_per_second)) + 1
-        onset_roll = np.zeros((frames_num, self.classes_num))
-        reg_onset_roll = np.ones((frames_num, self.classes_num))
-        frame_roll = np.zeros((frames_num, self.classes_num))
 
-        mask_roll = np.ones((frames_num, self.classes_num))
+        if out_dict is not None:
+            onset_roll = out_dict['onset_roll']
+            onset_roll[:] = 0
+            reg_onset_roll = out_dict['reg_onset_roll']
+            reg_onset_roll[:] = 1
+            frame_roll = out_dict['frame_roll']
+            frame_roll[:] = 0
+            mask_roll = out_dict['mask_roll']
+            mask_roll[:] = 1
+
+        else:
+            onset_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+            reg_onset_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
+            frame_roll = np.zeros((frames_num, self.classes_num), dtype=np.float32)
+
+            mask_roll = np.ones((frames_num, self.classes_num), dtype=np.float32)
         # mask_roll is used for masking out cross segment notes
 
         # ------ 2. Get note targets ------
@@ -180,6 +196,38 @@ class TargetProcessor:
 
         return target_dict    
 
+    def pkl2spans(self,
+                  start_time: float,
+                  segment_seconds: float,
+                  note_events,
+                  note_shift=0):
+        r"""Reduce note events to (bgn_frames, fin_frames, piano_notes)
+        arrays covering the same cells pkl2roll sets in its frame_roll.
+        Callers that only need the frame roll can write those spans directly
+        instead of paying for whole (frames, classes) slabs plus the unused
+        onset and regression rolls."""
+        bgn_frames = []
+        fin_frames = []
+        piano_notes = []
+
+        for note_event in note_events:
+            piano_note = np.clip(note_event['midi_note'] - self.begin_note + note_shift, 0, self.max_piano_note)
+
+            if 0 <= piano_note <= self.max_piano_note:
+                bgn_frame = int(round((note_event['onset_time'] - start_time) * self.frames_per_second))
+                fin_frame = int(round((note_event['offset_time'] - start_time) * self.frames_per_second))
+
+                if fin_frame >= 0:
+                    bgn_frames.append(max(bgn_frame, 0))
+                    fin_frames.append(fin_frame)
+                    piano_notes.append(piano_note)
+
+        return (
+            np.array(bgn_frames, dtype=np.int64),
+            np.array(fin_frames, dtype=np.int64),
+            np.array(piano_notes, dtype=np.int64),
+        )
+
     def process_beats(self, start_time: float, segment_seconds: float, beats, note_shift=0):
 
         segment_frames = int(self.frames_per_second * segment_seconds)
@@ -0,0 +1,64 @@
+import argparse
+import pickle
+from pathlib import Path
+
+import numpy as np
+import tqdm
+
+
+def pkl_to_npz(pkl_path):
+    r"""Convert one track's note-event pickle into a columnar .npz table.
+
+    The pickle stores an {instrument: {'note_event': [...], 'program_num':
+    ...}} dict where every note is a Python dict, so segment loaders
+    re-unpickle and pointer-chase the whole track on each access. The .npz
+    table keeps one array per column plus instrument offsets, and can be
+    memory-mapped so DataLoader workers share the OS page cache.
+
+    Args:
+        pkl_path: Path
+
+    Returns:
+        None
+    """
+    events_dict = pickle.load(open(pkl_path, 'rb'))
+
+    starts = []
+    ends = []
+    pitches = []
+    program_nums = []
+    instrument_offsets = [0]
+
+    for key in events_dict.keys():
+        note_events = events_dict[key]['note_event']
+
+        starts.extend(note_event['start'] for note_event in note_events)
+        ends.extend(note_event['end'] for note_event in note_events)
+        pitches.extend(note_event['pitch'] for note_event in note_events)
+        program_nums.append(events_dict[key]['program_num'])
+        instrument_offsets.append(instrument_offsets[-1] + len(note_events))
+
+    np.savez(
+        pkl_path.with_suffix('.npz'),
+        start=np.array(starts, dtype=np.float64),
+        end=np.array(ends, dtype=np.float64),
+        pitch=np.array(pitches, dtype=np.int64),
+        program_num=np.array(program_nums, dtype=np.int64),
+        instrument_offsets=np.array(instrument_offsets, dtype=np.int64),
+    )
+
+
+def main(args):
+    pkl_list = sorted(Path(args.notes_pkls_dir).glob('*.pkl'))
+
+    for pkl_path in tqdm.tqdm(pkl_list):
+        pkl_to_npz(pkl_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--notes_pkls_dir', type=str, required=True, help='Directory of note-event pickles.'
+    )
+    args = parser.parse_args()
+    main(args)
@@ -1,6 +1,7 @@
 import hydra
 from hydra.utils import to_absolute_path
 import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
 import numpy as np
 import pickle
 from End2End.target_processors import TargetProcessor
@@ -62,29 +63,34 @@ def main(cfg):
                                              segment_seconds,
                                              note_event,
                                              target_processor)
-                hf.create_dataset(piece_name, data=flat_frame_roll) 
+                # bitshuffle+LZ4 (filter 32008): the bool rolls compress
+                # heavily and decode faster than they read uncompressed.
+                hf.create_dataset(
+                    piece_name,
+                    data=flat_frame_roll,
+                    chunks=flat_frame_roll.shape,
+                    compression=32008,
+                    compression_opts=(0, 2),
+                )
     
     
 def event2roll(start_time, segment_seconds, note_events, target_processor):
-    keys = list(note_events.keys())
-    key = keys[0]
-    target_dict_per_plugin = target_processor.pkl2roll(start_time=0, 
-                                                                    segment_seconds=segment_seconds,
-                                                                    note_events=note_events[key],
-                                                                   )
-    frame_roll = target_dict_per_plugin['frame_roll']
-    placeholder = np.zeros_like(frame_roll).astype('bool')
-    placeholder = np.expand_dims(placeholder,0)
-    placeholder = placeholder.repeat(39,0)
-    
-    placeholder[MIDIClassName2class_idx[key]] = frame_roll
-    for key in keys[1:]:
-        target_dict_per_plugin = target_processor.pkl2roll(start_time=0, 
-                                                                        segment_seconds=segment_seconds,
-                                                                        note_events=note_events[key],
-                                                                       )    
-        placeholder[MIDIClassName2class_idx[key]] = target_dict_per_plugin['frame_roll']
-        
+    frames_num = int(round(segment_seconds * frames_per_second)) + 1
+    placeholder = np.zeros((MIDI_Class_NUM, frames_num, 88), dtype='bool')
+
+    for key in note_events.keys():
+        channel = MIDIClassName2class_idx[key]
+        bgn_frames, fin_frames, piano_notes = target_processor.pkl2spans(
+            start_time=start_time,
+            segment_seconds=segment_seconds,
+            note_events=note_events[key],
+        )
+
+        # Write only the populated [bgn, fin] note spans instead of
+        # assigning a whole (frames, 88) slab per plugin.
+        for bgn_frame, fin_frame, piano_note in zip(bgn_frames, fin_frames, piano_notes):
+            placeholder[channel, bgn_frame : fin_frame + 1, piano_note] = True
+
     return placeholder
 
 
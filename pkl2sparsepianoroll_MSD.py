@@ -1,3 +1,5 @@
+import concurrent.futures
+import functools
 import hydra
 from hydra.utils import to_absolute_path
 import sparse
@@ -28,61 +30,102 @@ SAMPLE_RATE=16000
 def main(cfg):
     
     pkl_path = to_absolute_path(cfg.pkl_path)
-    cfg.roll_output_path = to_absolute_path(cfg.roll_output_path) 
+    cfg.roll_output_path = to_absolute_path(cfg.roll_output_path)
     Path(cfg.roll_output_path).mkdir(parents=True, exist_ok=True)
- 
-    
-    
-    target_processor = TargetProcessor(frames_per_second=frames_per_second,
-                                       begin_note=21,
-                                       classes_num=88)
-    
-    pkl_list = list(Path(pkl_path).glob('*.pkl'))
-    for pkl_path in tqdm.tqdm(sorted(pkl_list)):
-        piece_name = pkl_path.name[:-4]
-        note_event = pickle.load(open(pkl_path, 'rb'))
+
+    pkl_list = sorted(Path(pkl_path).glob('*.pkl'))
+
+    # Each track converts independently, so fan the loop out over every
+    # core instead of running serially.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        jobs = executor.map(
+            functools.partial(_convert_one, roll_output_path=cfg.roll_output_path),
+            pkl_list,
+            chunksize=64,
+        )
+
+        for _ in tqdm.tqdm(jobs, total=len(pkl_list)):
+            pass
+
+
+def _convert_one(pkl_path, roll_output_path):
+    piece_name = pkl_path.name[:-4]
+    note_event = pickle.load(open(pkl_path, 'rb'))
 #         valid_length = len(h5[piece_name][()])
 #             audio, _ = torchaudio.load(to_absolute_path(f'../MTAT/{piece_name}'))
-        valid_length = 16000*30
-        segment_seconds = valid_length/SAMPLE_RATE
-
+    valid_length = 16000*30
+    segment_seconds = valid_length/SAMPLE_RATE
 
-        flat_frame_roll = event2roll(0,
-                                     segment_seconds,
-                                     note_event,
-                                     target_processor)
-        
-        # The native torch is having a bug for bool
-        # https://github.com/pytorch/pytorch/issues/49977
+    # The native torch is having a bug for bool
+    # https://github.com/pytorch/pytorch/issues/49977
 #         sparse_roll  = torch.tensor(flat_frame_roll).to_sparse()
 #         torch.save(sparse_roll, os.path.join(cfg.roll_output_path, f'''{piece_name.replace("['", "").replace("']", "")}.pt'''))
-        sparse_roll = sparse.COO(flat_frame_roll)
-        sparse.save_npz(os.path.join(cfg.roll_output_path,
-                                     f'''{piece_name.replace("['", "").replace("']", "")}'''),
-                        sparse_roll)
+    sparse_roll = event2roll(0,
+                             segment_seconds,
+                             note_event,
+                             None)
+    sparse.save_npz(os.path.join(roll_output_path,
+                                 f'''{piece_name.replace("['", "").replace("']", "")}'''),
+                    sparse_roll)
+
 
-    
 def event2roll(start_time, segment_seconds, note_events, target_processor):
-    keys = list(note_events.keys())
-    key = keys[0]
-    target_dict_per_plugin = target_processor.pkl2roll(start_time=0, 
-                                                                    segment_seconds=segment_seconds,
-                                                                    note_events=note_events[key],
-                                                                   )
-    frame_roll = target_dict_per_plugin['frame_roll']
-    placeholder = np.zeros_like(frame_roll).astype('bool')
-    placeholder = np.expand_dims(placeholder,0)
-    placeholder = placeholder.repeat(39,0)
-    
-    placeholder[MIDIClassName2class_idx[key]] = frame_roll
-    for key in keys[1:]:
-        target_dict_per_plugin = target_processor.pkl2roll(start_time=0, 
-                                                                        segment_seconds=segment_seconds,
-                                                                        note_events=note_events[key],
-                                                                       )    
-        placeholder[MIDIClassName2class_idx[key]] = target_dict_per_plugin['frame_roll']
-        
-    return placeholder
+    r"""Build the (classes, frames, 88) roll directly as sparse COO
+    coordinates. The rolls are >99% zero, so the dense bool intermediate
+    and the nonzero scan sparse.COO would run over it are both skipped."""
+    frames_num = int(round(segment_seconds * frames_per_second)) + 1
+
+    linear_list = []
+
+    for key in note_events.keys():
+        events = note_events[key]
+
+        midi_notes = np.array([e['midi_note'] for e in events], dtype=np.int64)
+        bgn_frames = np.round(
+            (np.array([e['onset_time'] for e in events]) - start_time) * frames_per_second
+        ).astype(np.int64)
+        fin_frames = np.round(
+            (np.array([e['offset_time'] for e in events]) - start_time) * frames_per_second
+        ).astype(np.int64)
+        pitches = np.clip(midi_notes - 21, 0, 87)
+
+        keep = fin_frames >= 0
+        bgn = np.clip(bgn_frames[keep], 0, frames_num)
+        end = np.clip(fin_frames[keep] + 1, 0, frames_num)
+        pitches = pitches[keep]
+
+        span = end > bgn
+        bgn = bgn[span]
+        end = end[span]
+        pitches = pitches[span]
+
+        lens = end - bgn
+        if len(lens) == 0:
+            continue
+
+        # Expand every [bgn, end) span into frame indices in one shot:
+        # repeat each span's start offset and add a running counter.
+        cum = np.cumsum(lens)
+        times = np.arange(cum[-1]) + np.repeat(bgn - np.concatenate(([0], cum[:-1])), lens)
+
+        channel = MIDIClassName2class_idx[key]
+        linear_list.append((channel * frames_num + times) * 88 + np.repeat(pitches, lens))
+
+    if linear_list:
+        # Overlapping notes hit the same cell; unique both dedupes and
+        # sorts the linearized coordinates.
+        linear = np.unique(np.concatenate(linear_list))
+    else:
+        linear = np.array([], dtype=np.int64)
+
+    channels, rest = np.divmod(linear, frames_num * 88)
+    times, pitch_coords = np.divmod(rest, 88)
+
+    return sparse.COO(
+        coords=np.stack([channels, times, pitch_coords]),
+        data=np.ones(len(linear), dtype=np.bool_),
+        shape=(MIDI_Class_NUM, frames_num, 88),
+    )
 
 
 
@@ -0,0 +1,67 @@
+import argparse
+from pathlib import Path
+
+import h5py
+import hdf5plugin  # registers the bitshuffle/LZ4 hdf5 filter
+import numpy as np
+import tqdm
+
+SEGMENT_SAMPLES = 160000
+
+
+def rechunk_hdf5(hdf5_path):
+    r"""Re-store one waveform hdf5 with segment-sized chunks.
+
+    Files written before the ingestion script chunked its output store the
+    waveform contiguously, so every random segment read pays the worst-case
+    access pattern and the h5py chunk cache never gets a hit. Rewriting the
+    waveform with one chunk per training segment makes a segment read decode
+    exactly one chunk. Everything else in the file is copied as is, and the
+    rewrite replaces the original atomically.
+
+    Args:
+        hdf5_path: Path
+
+    Returns:
+        None
+    """
+    tmp_path = hdf5_path.with_name(hdf5_path.name + '.tmp')
+
+    with h5py.File(hdf5_path, 'r') as src_hf, h5py.File(tmp_path, 'w') as dst_hf:
+        for key, value in src_hf.attrs.items():
+            dst_hf.attrs[key] = value
+
+        for name in src_hf.keys():
+            if name == 'waveform':
+                waveform = src_hf['waveform'][:]
+
+                # Same layout the ingestion script now writes: one chunk
+                # per segment, bitshuffle+LZ4 (filter 32008).
+                dst_hf.create_dataset(
+                    name='waveform',
+                    data=waveform,
+                    dtype=np.int16,
+                    chunks=(min(len(waveform), SEGMENT_SAMPLES),),
+                    compression=32008,
+                    compression_opts=(0, 2),
+                )
+            else:
+                src_hf.copy(name, dst_hf)
+
+    tmp_path.replace(hdf5_path)
+
+
+def main(args):
+    hdf5_paths = sorted(Path(args.waveform_hdf5s_dir).rglob('*.h5'))
+
+    for hdf5_path in tqdm.tqdm(hdf5_paths):
+        rechunk_hdf5(hdf5_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--waveform_hdf5s_dir', type=str, required=True, help='Directory of waveform hdf5s.'
+    )
+    args = parser.parse_args()
+    main(args)
@@ -35,6 +35,107 @@ from hydra.utils import to_absolute_path
 
 
 
+def _build_backbone(cfg):
+    return getattr(BackBone, cfg.detection.backbone.type)(**cfg.detection.backbone.args)
+
+
+def _build_linear_model(cfg):
+    linear = nn.Linear(cfg.detection.transformer.hidden_dim*15*3, cfg.detection.transformer.hidden_dim)
+    return getattr(CombinedModel, cfg.detection.type)(
+                                     cfg.detection.model,
+                                     backbone=_build_backbone(cfg),
+                                     linear=linear,
+                                     spec_args=cfg.feature
+                                     )
+
+
+def _build_cls_model(cfg):
+    encoder = getattr(Transformer, cfg.detection.transformer.type)(cfg.detection.transformer.args)
+    return getattr(CombinedModel, cfg.detection.type)(
+                                     cfg.detection.model,
+                                     backbone=_build_backbone(cfg),
+                                     encoder=encoder,
+                                     spec_args=cfg.feature
+                                     )
+
+
+def _build_newcls_model(cfg):
+    encoder = getattr(Transformer, cfg.detection.transformer.type)(**cfg.detection.transformer.args)
+    return getattr(CombinedModel, cfg.detection.type)(
+                                     cfg.detection.model,
+                                     backbone=_build_backbone(cfg),
+                                     encoder=encoder,
+                                     spec_args=cfg.detection.feature
+                                     )
+
+
+def _build_original_model(cfg):
+    return getattr(CombinedModel, cfg.detection.type)(
+                                     cfg.detection.model,
+                                     backbone=_build_backbone(cfg),
+                                     spec_args=cfg.feature
+                                     )
+
+
+def _build_a_model(cfg):
+    transformer = nn.Transformer(**cfg.detection.transformer.args)
+    return getattr(CombinedModel, cfg.detection.type)(
+                                     cfg.detection.model,
+                                     backbone=_build_backbone(cfg),
+                                     transformer=transformer,
+                                     spec_args=cfg.feature
+                                     )
+
+
+def _build_openmic_model(cfg):
+    # OpenMicBaseline has no backbone, so nothing heavy is built here.
+    return DecisionLevelSingleAttention(
+                                     **cfg.detection.model.args,
+                                     spec_args=cfg.feature
+                                     )
+
+
+def _build_transformer_model(cfg):
+    if cfg.detection.transformer.type=='torch_Transformer_API':
+        print(f"using torch transformer")
+        transformer = nn.Transformer(**cfg.detection.transformer.args)
+    else:
+        transformer = getattr(Transformer, cfg.detection.transformer.type)(**cfg.detection.transformer.args)
+    return getattr(CombinedModel, cfg.detection.type)(
+                                     cfg.detection.model,
+                                     backbone=_build_backbone(cfg),
+                                     transformer=transformer,
+                                     spec_args=cfg.feature
+                                     )
+
+
+DETECTION_BUILDERS = {
+    'CombinedModel_Linear': _build_linear_model,
+    'OpenMicBaseline': _build_openmic_model,
+}
+
+# Model families matched by substring, in the order the old if cascade
+# checked them.
+DETECTION_FAMILY_BUILDERS = (
+    ('CombinedModel_CLS', _build_cls_model),
+    ('CombinedModel_NewCLS', _build_newcls_model),
+    ('Original', _build_original_model),
+    ('CombinedModel_A', _build_a_model),
+)
+
+
+def _detection_builder(detection_type):
+    builder = DETECTION_BUILDERS.get(detection_type)
+    if builder is not None:
+        return builder
+
+    for key, family_builder in DETECTION_FAMILY_BUILDERS:
+        if key in detection_type:
+            return family_builder
+
+    return _build_transformer_model
+
+
 @hydra.main(config_path="End2End/config/", config_name="jointist_testing")
 def main(cfg):
     r"""Train an instrument classification system, evluate, and save checkpoints.
@@ -85,66 +186,9 @@ def main(cfg):
                                                     cfg=cfg)
     
 
-    # defining instrument detection model
-    if cfg.detection.type!='OpenMicBaseline': # only need backbone when doing transformer based models
-        backbone = getattr(BackBone, cfg.detection.backbone.type)(**cfg.detection.backbone.args)
-    
-    
-    if cfg.detection.type=='CombinedModel_Linear':
-        linear = nn.Linear(cfg.detection.transformer.hidden_dim*15*3, cfg.detection.transformer.hidden_dim)
-        model = getattr(CombinedModel, cfg.detection.type)(
-                                         cfg.detection.model,
-                                         backbone=backbone,
-                                         linear=linear,
-                                         spec_args=cfg.feature
-                                         )
-    elif 'CombinedModel_CLS' in cfg.detection.type:
-        encoder = getattr(Transformer, cfg.detection.transformer.type)(cfg.detection.transformer.args)
-        model = getattr(CombinedModel, cfg.detection.type)(
-                                         cfg.detection.model,
-                                         backbone=backbone,
-                                         encoder=encoder,
-                                         spec_args=cfg.feature
-                                         )
-    elif 'CombinedModel_NewCLS' in cfg.detection.type:
-        encoder = getattr(Transformer, cfg.detection.transformer.type)(**cfg.detection.transformer.args)
-        model = getattr(CombinedModel, cfg.detection.type)(
-                                         cfg.detection.model,
-                                         backbone=backbone,
-                                         encoder=encoder,
-                                         spec_args=cfg.detection.feature
-                                         )        
-    elif 'Original' in cfg.detection.type:
-        model = getattr(CombinedModel, cfg.detection.type)(
-                                         cfg.detection.model,
-                                         backbone=backbone,
-                                         spec_args=cfg.feature
-                                         )
-    elif 'CombinedModel_A' in cfg.detection.type:
-        transformer = nn.Transformer(**cfg.detection.transformer.args)
-        model = getattr(CombinedModel, cfg.detection.type)(
-                                         cfg.detection.model,
-                                         backbone=backbone,
-                                         transformer=transformer,
-                                         spec_args=cfg.feature
-                                         )
-    elif cfg.detection.type=='OpenMicBaseline':
-        model = DecisionLevelSingleAttention(
-                                         **cfg.detection.model.args,
-                                         spec_args=cfg.feature
-                                         )        
-    else:
-        if cfg.detection.transformer.type=='torch_Transformer_API':
-            print(f"using torch transformer")
-            transformer = nn.Transformer(**cfg.detection.transformer.args)
-        else:
-            transformer = getattr(Transformer, cfg.detection.transformer.type)(**cfg.detection.transformer.args)
-        model = getattr(CombinedModel, cfg.detection.type)(
-                                         cfg.detection.model,
-                                         backbone=backbone,
-                                         transformer=transformer,
-                                         spec_args=cfg.feature
-                                         )
+    # defining instrument detection model; each builder constructs the
+    # backbone and encoder only for the model family that uses them.
+    model = _detection_builder(cfg.detection.type)(cfg)
 
     detection_model = getattr(Detection, cfg.detection.task).load_from_checkpoint(to_absolute_path(cfg.checkpoint.detection),
                                               network=model,
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+_data_modules = pytest.importorskip('End2End.data._data_modules')
+
+
+def test_collate_fn_round_trips_scalars():
+    r"""The compiled collate must stack array entries and scalar entries
+    (e.g. 'valid_length') alike."""
+    list_data_dict = [
+        {
+            'waveform': np.arange(4, dtype=np.float32) + i,
+            'valid_length': 4 - i,
+        }
+        for i in range(2)
+    ]
+
+    batch = _data_modules.collate_fn(list_data_dict)
+
+    assert batch['waveform'].shape == (2, 4)
+    assert batch['waveform'].dtype == torch.float32
+    assert torch.equal(batch['waveform'][1], torch.arange(4, dtype=torch.float32) + 1)
+
+    assert batch['valid_length'].shape == (2,)
+    assert batch['valid_length'].tolist() == [4, 3]